@@ -1,57 +1,259 @@
+from time import perf_counter
 from kivy.logger import Logger
 from jnius import autoclass, PythonJavaClass, java_method
 
+import metrics
+
 MediaPlayer = autoclass('android.media.MediaPlayer')
 KivyCompletionListener = autoclass('org.kivy.player.KivyCompletionListener')
+KivyPreparedListener = autoclass('org.kivy.player.KivyPreparedListener')
+KivyErrorListener = autoclass('org.kivy.player.KivyErrorListener')
 Uri = autoclass('android.net.Uri')
 
+# MediaSlot states
+IDLE = 'idle'
+PREPARING = 'preparing'
+PREPARED = 'prepared'
+STARTED = 'started'     # includes paused and completed
+
+
+##################################################################
+# Tracks are prepared with prepareAsync(), so start() never blocks.
+# A start() of a different track while a prepare is in progress resets
+# the player and prepares the new track at once, so the wanted track
+# never waits for a prepare that will be discarded. Each prepare is
+# numbered, and events from an earlier prepare of the slot are ignored.
+#
+# Gapless playback uses two MediaPlayers. While one plays, the next
+# track is prepared on the other and chained with setNextMediaPlayer(),
+# so Android starts it as the first completes. The players swap roles
+# when the next track is started.
+#
+# A MediaPlayer error, for example a prepare of a missing or corrupt
+# file, resets only that player. If it was to play the wanted track,
+# that track is skipped, else the wanted track is prepared.
+#
+# Android calls the listeners on its own thread, init_player(post=...)
+# passes the prepared and error events to the caller's thread.
+##################################################################
+
+class MediaSlot():
+    # A MediaPlayer, its state, and its data source
+
+    def __init__(self, media_player, callback_wrapper):
+        self.media_player = media_player
+        self.callback_wrapper = callback_wrapper
+        self.state = IDLE
+        self.uri = None
+        self.prepare_time = 0       # perf_counter() at prepareAsync()
+        self.prepares = 0           # numbers the prepare events are for
+
 
 class AndroidMediaPlayer():
 
     # self.player.setWakeMode(getApplicationContext(), PowerManager.PARTIAL_WAKE_LOCK)
 
-    def init_player(self, service_callback):
-        self.callback_wrapper = CallbackWrapper(service_callback,
-                                                self.error_handler)
-        self.player = MediaPlayer()
-        self.player.setOnCompletionListener(
-            KivyCompletionListener(self.callback_wrapper))
+    def __init__(self, gapless = True):
+        self.gapless = gapless
+        self.want_uri = None        # the track to play
+        self.want_next_uri = None   # the track to play next
+
+    def init_player(self, service_callback, post = None):
+        # post(action, *args) calls action on the caller's thread
+        self.post = post or (lambda action, *args: action(*args))
+        self.service_callback = service_callback
+        self.current = self.new_slot(service_callback)
+        self.next = self.new_slot(service_callback) if self.gapless else None
+
+    def new_slot(self, service_callback):
+        media_player = MediaPlayer()
+        slot = MediaSlot(media_player, None)
+        slot.callback_wrapper = CallbackWrapper(
+            service_callback,
+            lambda: self.post(self.slot_error, slot, slot.prepares),
+            lambda: self.post(self.prepared, slot, slot.prepares))
+        media_player.setOnCompletionListener(
+            KivyCompletionListener(slot.callback_wrapper))
+        media_player.setOnPreparedListener(
+            KivyPreparedListener(slot.callback_wrapper))
+        media_player.setOnErrorListener(
+            KivyErrorListener(slot.callback_wrapper))
+        return slot
 
+    ##################
+    # Player Actions
+    ##################
+
+    @metrics.timed('media_player.start')
     def start(self, mActivity, uri):
+        self.context = mActivity
+        self.want_uri = uri
         try:
-            self.player.reset()
-            self.player.setDataSource(mActivity, Uri.parse(uri))
-            self.player.prepare()
-            self.player.start()
+            if self.current.state == PREPARING and uri == self.current.uri:
+                return
+            if self.gapless and uri == self.next.uri and\
+               self.next.state in (PREPARING, PREPARED):
+                self.swap()
+            else:
+                self.prepare(self.current, uri)
         except Exception as e:
-            Logger.warning('Android Media Player prepare() failed.\n' +\
+            Logger.warning('Android Media Player start failed.\n' + str(e))
+
+    def prepare_next(self, mActivity, uri):
+        if not self.gapless:
+            return
+        self.context = mActivity
+        self.want_next_uri = uri
+        try:
+            if self.next.state == PREPARING and uri == self.next.uri:
+                return
+            if self.next.uri == uri and self.next.state == PREPARED:
+                self.chain()
+            else:
+                self.prepare(self.next, uri)
+        except Exception as e:
+            Logger.warning('Android Media Player prepare next failed.\n' +\
                            str(e))
 
     def pause(self):
-        self.player.pause()
+        if self.current.state == STARTED:
+            self.current.media_player.pause()
+        elif self.current.state == PREPARING:
+            self.want_uri = None
     
     def resume(self):
-        self.player.start()
+        if self.current.state in (PREPARED, STARTED):
+            self.current.media_player.start()
+            self.current.state = STARTED
+            self.chain()
+        elif self.current.state == PREPARING:
+            self.want_uri = self.current.uri
     
     def stop(self):
-        self.player.stop()
+        if self.current.state in (PREPARED, STARTED):
+            self.unchain()
+            self.current.media_player.stop()
+            self.current.state = IDLE
+            self.current.uri = None
+        self.want_uri = None
 
     def release(self):
-        self.player.release()
+        self.current.media_player.release()
+        if self.next:
+            self.next.media_player.release()
+
+    ##################
+    # Player Events
+    ##################
 
-    def error_handler(self):
-        Logger.warning('Android Media Player was reset due to an error.')
-        self.player.reset()
+    def prepared(self, slot, prepares):
+        # Called on the thread that calls start()
+        if prepares != slot.prepares or slot.state != PREPARING:
+            # From a prepare that was replaced
+            return
+        slot.state = PREPARED
+        if metrics.enabled():
+            metrics.record('media_player.prepare_async',
+                           perf_counter() - slot.prepare_time)
+        try:
+            if slot is self.current:
+                if self.want_uri is None:
+                    return
+                if slot.uri != self.want_uri:
+                    self.prepare(slot, self.want_uri)
+                    return
+                slot.media_player.start()
+                slot.state = STARTED
+                self.chain()
+            elif slot is self.next:
+                if slot.uri != self.want_next_uri:
+                    self.prepare(slot, self.want_next_uri)
+                    return
+                self.chain()
+        except Exception as e:
+            Logger.warning('Android Media Player prepared failed.\n' +\
+                           str(e))
+
+    def slot_error(self, slot, prepares):
+        # Called on the thread that calls start()
+        if slot.state == IDLE or prepares != slot.prepares:
+            return
+        Logger.warning('Android Media Player error, the player was reset.')
+        failed = slot.uri
+        try:
+            if slot is self.next:
+                self.unchain()
+            slot.media_player.reset()
+            slot.state = IDLE
+            slot.uri = None
+            if slot is self.current:
+                if self.want_uri is None:
+                    return
+                if failed != self.want_uri:
+                    self.prepare(slot, self.want_uri)
+                else:
+                    self.want_uri = None
+                    self.service_callback()
+            elif slot is self.next:
+                if self.want_next_uri is not None and\
+                   failed != self.want_next_uri:
+                    self.prepare(slot, self.want_next_uri)
+        except Exception as e:
+            Logger.warning('Android Media Player error recovery failed.\n' +\
+                           str(e))
+
+    ##################
+    # Slots
+    ##################
+
+    def prepare(self, slot, uri):
+        if slot is self.current:
+            self.unchain()
+        slot.state = IDLE
+        slot.uri = None
+        slot.media_player.reset()
+        slot.prepares += 1
+        slot.media_player.setDataSource(self.context, Uri.parse(uri))
+        slot.media_player.prepareAsync()
+        slot.prepare_time = perf_counter()
+        slot.state = PREPARING
+        slot.uri = uri
+
+    def swap(self):
+        # The next player is prepared or preparing, and is playing if the
+        # previous track completed.
+        self.unchain()
+        previous = self.current
+        self.current, self.next = self.next, self.current
+        if self.current.state == PREPARED:
+            if not self.current.media_player.isPlaying():
+                self.current.media_player.start()
+            self.current.state = STARTED
+        previous.media_player.reset()
+        previous.state = IDLE
+        previous.uri = None
+
+    def chain(self):
+        if self.gapless and self.current.state == STARTED and\
+           self.next.state == PREPARED and self.next.uri == self.want_next_uri:
+            self.current.media_player.setNextMediaPlayer(
+                self.next.media_player)
+
+    def unchain(self):
+        if self.gapless and self.current.state in (PREPARED, STARTED):
+            self.current.media_player.setNextMediaPlayer(None)
         
 
 class CallbackWrapper(PythonJavaClass):
     __javacontext__ = 'app'
     __javainterfaces__ = ['org/kivy/player/CallbackWrapper']
 
-    def __init__(self, service_callback, error_callback):
+    def __init__(self, service_callback, error_callback,
+                 prepared_callback = None):
         super().__init__()
         self.service_callback = service_callback
         self.error_callback = error_callback
+        self.prepared_callback = prepared_callback
 
     @java_method('()V')        
     def on_completion(self):
@@ -60,7 +262,11 @@ class CallbackWrapper(PythonJavaClass):
 
     @java_method('()V')        
     def on_error(self):
+        # The error callback decides if the track is skipped
         if self.error_callback:
             self.error_callback()
-        if self.service_callback:            
-            self.service_callback()     
+
+    @java_method('()V')        
+    def on_prepared(self):
+        if self.prepared_callback:
+            self.prepared_callback()
@@ -0,0 +1,71 @@
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mediastore_catalog import SQLiteSource
+from library import library
+
+##################################################################
+# Albums in a genre, from every track row filtered by album name (as
+# list_albums_in_genre did), and from one row per album grouped by
+# album_id (as album_pages does), for a 50k track, 3k album library.
+#
+# On a device each row read costs JNI calls, moveToNext() and one per
+# column, these are counted as crossings.
+##################################################################
+
+TRACKS = 50000
+ALBUMS = 3000
+GENRES = 5
+
+
+def by_track(connection, genre_id):
+    cursor = connection.execute(
+        'SELECT _id, album, album_id, genre_id FROM audio WHERE genre_id=? '
+        'ORDER BY album ASC', (genre_id,))
+    albums = []
+    rows = 0
+    previous_album_name = ''
+    for track_id, album, album_id, genre in cursor:
+        rows += 1
+        if album != previous_album_name:
+            albums.append((album, album_id, track_id))
+        previous_album_name = album
+    return albums, rows, rows * 4
+
+
+def by_album(connection, genre_id):
+    cursor = connection.execute(
+        'SELECT _id, album, album_id FROM audio WHERE genre_id=? '
+        'GROUP BY album_id ORDER BY album ASC', (genre_id,))
+    albums = []
+    rows = 0
+    for track_id, album, album_id in cursor:
+        rows += 1
+        albums.append((album, album_id, track_id))
+    return albums, rows, rows * 4
+
+
+def timed(query, connection, genre_id, repeat = 5):
+    start = perf_counter()
+    for i in range(repeat):
+        albums, rows, crossings = query(connection, genre_id)
+    elapsed = (perf_counter() - start) / repeat
+    return {'albums': len(albums), 'rows': rows, 'crossings': crossings,
+            'ms': elapsed * 1e3}
+
+
+def run():
+    source = SQLiteSource()
+    source.create()
+    source.insert(library(TRACKS, ALBUMS, GENRES))
+    return {'by_track': timed(by_track, source.connection, 0),
+            'by_album': timed(by_album, source.connection, 0)}
+
+
+if __name__ == '__main__':
+    for query, result in run().items():
+        print(query, ' '.join('{}={}'.format(k, round(v, 2))
+                              for k, v in result.items()))
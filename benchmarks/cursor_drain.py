@@ -0,0 +1,54 @@
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mediastore_catalog import SQLiteSource
+from cursor_columns import read_columns
+from fakes import FakeCursor, FakeCursorDrain
+from library import library
+
+##################################################################
+# Reading the catalog scan columns from a cursor, a row at a time and
+# with CursorDrain.
+#
+# The cursor is a stand-in, so the time is the Python side, and for the
+# drain the stand-in packing the columns as Java would. On a device each
+# call is a JNI call, device_ms estimates their cost at JNI_CALL_US each.
+##################################################################
+
+SIZES = [1000, 10000, 50000]
+JNI_CALL_US = 2
+LONGS = ['_id', 'album_id', 'genre_id', 'date_modified']
+STRINGS = ['title', 'album', 'album_artist', 'genre']
+
+
+def read(connection, drain_class):
+    cursor = FakeCursor(connection, 'SELECT * FROM audio')
+    start = perf_counter()
+    columns = read_columns(cursor, LONGS, STRINGS, drain_class)
+    elapsed = perf_counter() - start
+    return columns, {'calls': cursor.calls, 'ms': elapsed * 1e3,
+                     'device_ms': elapsed * 1e3 +
+                     cursor.calls * JNI_CALL_US / 1e3}
+
+
+def run():
+    results = {}
+    for size in SIZES:
+        source = SQLiteSource()
+        source.create()
+        source.insert(library(size))
+        by_row, row_result = read(source.connection, None)
+        bulk, bulk_result = read(source.connection, FakeCursorDrain)
+        assert by_row == bulk
+        results[size] = {'by_row': row_result, 'drain': bulk_result}
+    return results
+
+
+if __name__ == '__main__':
+    for size, result in run().items():
+        for method, values in result.items():
+            print(size, method, ' '.join('{}={:.1f}'.format(k, v)
+                                         for k, v in values.items()))
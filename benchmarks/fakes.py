@@ -0,0 +1,161 @@
+##################################################################
+# Stand-ins for the Android and OSC objects used by the app,
+# for running app code off device.
+##################################################################
+
+class FakeMediaPlayer():
+    # Records calls, in place of AndroidMediaPlayer.
+
+    def __init__(self):
+        self.calls = []
+        self.uri = None
+        self.next_uri = None
+        self.callback = None
+
+    def init_player(self, callback, post = None):
+        self.callback = callback
+
+    def start(self, context, uri):
+        self.calls.append(('start', uri))
+        self.uri = uri
+
+    def prepare_next(self, context, uri):
+        self.next_uri = uri
+
+    def pause(self):
+        self.calls.append(('pause',))
+
+    def resume(self):
+        self.calls.append(('resume',))
+
+    def stop(self):
+        self.calls.append(('stop',))
+
+    def release(self):
+        self.calls.append(('release',))
+
+    def complete(self):
+        # As if the track finished, the callback is on a Java thread
+        self.callback()
+
+
+class FakeClient():
+    # Records messages, in place of an OSCClient.
+
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, address, values):
+        self.messages.append((address, values))
+
+
+class FakeServer():
+    # Dispatches messages to bound handlers, in place of an OSCThreadServer.
+
+    def __init__(self):
+        self.handlers = {}
+
+    def bind(self, address, handler):
+        self.handlers[address] = handler
+
+    def send(self, address, *values):
+        self.handlers[address](*values)
+
+
+class FakeClock():
+    # Kivy's Clock, scheduled callbacks run when tick() is called.
+
+    def __init__(self):
+        self.scheduled = []
+
+    def schedule_once(self, callback, timeout = 0):
+        self.scheduled.append(callback)
+
+    def create_trigger(self, callback, timeout = 0):
+        return FakeTrigger(self, callback)
+
+    def tick(self):
+        scheduled = self.scheduled
+        self.scheduled = []
+        for callback in scheduled:
+            callback(0)
+
+
+class FakeTrigger():
+
+    def __init__(self, clock, callback):
+        self.clock = clock
+        self.callback = callback
+
+    def __call__(self):
+        if self.callback not in self.clock.scheduled:
+            self.clock.scheduled.append(self.callback)
+
+    def cancel(self):
+        if self.callback in self.clock.scheduled:
+            self.clock.scheduled.remove(self.callback)
+
+
+class FakeCursor():
+    # An Android Cursor over the rows of a SQLite query, counts calls.
+
+    def __init__(self, connection, sql, parameters = ()):
+        sqlite_cursor = connection.execute(sql, parameters)
+        self.columns = [d[0] for d in sqlite_cursor.description]
+        self.rows = sqlite_cursor.fetchall()
+        self.position = -1
+        self.calls = 0
+
+    def getCount(self):
+        self.calls += 1
+        return len(self.rows)
+
+    def getPosition(self):
+        self.calls += 1
+        return self.position
+
+    def getColumnIndex(self, column):
+        self.calls += 1
+        return self.columns.index(column) if column in self.columns else -1
+
+    def moveToNext(self):
+        self.calls += 1
+        self.position += 1
+        return self.position < len(self.rows)
+
+    def moveToFirst(self):
+        self.calls += 1
+        self.position = 0
+        return bool(self.rows)
+
+    def moveToLast(self):
+        self.calls += 1
+        self.position = len(self.rows) - 1
+        return bool(self.rows)
+
+    def getLong(self, index):
+        self.calls += 1
+        return self.rows[self.position][index] or 0
+
+    def getString(self, index):
+        self.calls += 1
+        value = self.rows[self.position][index]
+        return None if value is None else str(value)
+
+    def close(self):
+        self.calls += 1
+
+
+class FakeCursorDrain():
+    # As org.kivy.player.CursorDrain, the constructor is one call.
+
+    def __init__(self, cursor, long_columns, string_columns):
+        cursor.calls += 1
+        rows = cursor.rows[cursor.position + 1:]
+        cursor.position = len(cursor.rows)
+        self.rows = len(rows)
+        indexes = [cursor.columns.index(c) for c in long_columns]
+        self.longs = [[row[i] or 0 for row in rows] for i in indexes]
+        indexes = [cursor.columns.index(c) for c in string_columns]
+        self.strings = [b''.join((row[i] or '').encode('utf8') + b'\0'
+                                 for row in rows) for i in indexes]
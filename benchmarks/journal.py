@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playlist_journal import PlaylistJournal
+
+##################################################################
+# Playlist journal recovery time and write amplification.
+#
+# A queue is built from 1000 track batches, with a position change after
+# each, as the Player would record them. Then the journal is reopened.
+##################################################################
+
+SIZES = [1000, 10000, 50000]
+
+
+def run():
+    results = {}
+    for size in SIZES:
+        directory = tempfile.mkdtemp()
+        journal = PlaylistJournal(directory, sync_interval = 0.05)
+        playlist, position = journal.load()
+        start = perf_counter()
+        changes = 0
+        for first in range(0, size, 1000):
+            ids = range(first, min(size, first + 1000))
+            playlist.extend(ids)
+            journal.extend(ids)
+            for position in range(first, first + len(ids), 10):
+                journal.position(position)
+                changes += 1
+            if journal.needs_compaction(playlist):
+                journal.compact(playlist, position)
+        record_time = perf_counter() - start
+        journal.close()
+        stats = journal.stats()
+        start = perf_counter()
+        recovered, recovered_position = PlaylistJournal(directory).load()
+        recovery_time = perf_counter() - start
+        assert list(recovered) == list(playlist)
+        assert recovered_position == position
+        results[size] = {'recovery_ms': recovery_time * 1e3,
+                         'record_us': record_time / changes * 1e6,
+                         'write_amplification': stats['write_amplification'],
+                         'bytes_written': stats['bytes_written']}
+    return results
+
+
+if __name__ == '__main__':
+    for size, result in run().items():
+        print(size, ' '.join('{}={:.2f}'.format(k, v)
+                             for k, v in result.items()))
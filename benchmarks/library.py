@@ -0,0 +1,35 @@
+import random
+
+##################################################################
+# Synthetic music libraries, as rows for SQLiteSource.insert().
+##################################################################
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'to', 'vi', 'ze', 'an',
+             'the', 'or', 'el', 'ba', 'di']
+
+
+def name(rng, words):
+    return ' '.join(''.join(rng.choice(SYLLABLES)
+                            for s in range(rng.randint(1, 4))).title()
+                    for w in range(words))
+
+
+def library(tracks, albums = None, genres = 20, seed = 1):
+    # Returns rows of (_id, title, _display_name, album_id, album,
+    # album_artist, genre_id, genre, date_modified), tracks are spread
+    # evenly over albums, by default 10 tracks per album.
+    rng = random.Random(seed)
+    albums = albums or max(1, tracks // 10)
+    album_names = [name(rng, 2) for a in range(albums)]
+    # Some albums share a name, as "Greatest Hits" does
+    for a in range(0, albums, 50):
+        album_names[a] = 'Greatest Hits'
+    artists = [name(rng, 2) for a in range(albums)]
+    rows = []
+    for track_id in range(1, tracks + 1):
+        album_id = (track_id - 1) * albums // tracks
+        genre_id = album_id % genres
+        rows.append((track_id, name(rng, 3), str(track_id) + '.mp3',
+                     album_id, album_names[album_id], artists[album_id],
+                     genre_id, 'Genre ' + str(genre_id), 0))
+    return rows
@@ -0,0 +1,135 @@
+import os
+import sys
+from time import sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service_liveness import ServiceLiveness, RUNNING, BUSY, NOT_RUNNING
+from fakes import FakeClient, FakeClock
+
+##################################################################
+# Drives the UI's ServiceLiveness with a fake Clock. The expire
+# trigger and the pong's delivery to the main thread run on tick(), so
+# a main thread stall is a tick() that comes late.
+##################################################################
+
+
+def start_liveness(ttl = 2.0, timeout = 0.3):
+    client = FakeClient()
+    clock = FakeClock()
+    liveness = ServiceLiveness(client.send_message, ttl = ttl,
+                               timeout = timeout, busy_seconds = 1.0,
+                               busy_backlog = 50, clock = clock)
+    return liveness, client, clock
+
+
+def pings(client):
+    return len([m for m in client.messages if m[0] == b'/ping'])
+
+
+def check_ttl():
+    liveness, client, clock = start_liveness(ttl = 0.05)
+    statuses = []
+    liveness.check(statuses.append)
+    liveness.check(statuses.append)
+    # One ping for both checks
+    assert pings(client) == 1 and statuses == []
+    liveness.pong(0, 0)
+    clock.tick()
+    assert statuses == [RUNNING, RUNNING], statuses
+    # A fresh result is cached
+    liveness.check(statuses.append)
+    assert pings(client) == 1 and statuses[-1] == RUNNING
+    # and an old one is asked again
+    sleep(0.1)
+    liveness.check(statuses.append)
+    assert pings(client) == 2 and len(statuses) == 3
+
+
+def check_timeout():
+    liveness, client, clock = start_liveness()
+    statuses = []
+    liveness.check(statuses.append)
+    # The expire trigger runs, with no pong
+    clock.tick()
+    assert statuses == [NOT_RUNNING], statuses
+    # A later check pings again
+    liveness.forget()
+    liveness.check(statuses.append)
+    assert pings(client) == 2
+
+
+def check_busy():
+    for backlog, action_ms, status in [(0, 1000, RUNNING),
+                                       (0, 1001, BUSY),
+                                       (50, 0, RUNNING),
+                                       (51, 0, BUSY)]:
+        liveness, client, clock = start_liveness()
+        statuses = []
+        liveness.check(statuses.append)
+        liveness.pong(backlog, action_ms)
+        # The pong is delivered before the expire trigger runs
+        clock.scheduled.reverse()
+        clock.tick()
+        assert statuses == [status], (backlog, action_ms, statuses)
+
+
+def check_stalled_main_thread():
+    # The pong arrives on the OSC thread in time, but the main thread
+    # stalls, so the expire trigger runs before the pong is delivered.
+    liveness, client, clock = start_liveness()
+    statuses = []
+    liveness.check(statuses.append)
+    liveness.pong(0, 0)
+    clock.tick()
+    assert statuses == [RUNNING], statuses
+
+
+def check_late_pong():
+    # A pong after the timeout still shows the service is running
+    liveness, client, clock = start_liveness()
+    statuses = []
+    liveness.check(statuses.append)
+    clock.tick()
+    assert statuses == [NOT_RUNNING]
+    liveness.pong(0, 0)
+    clock.tick()
+    assert liveness.status == RUNNING
+    liveness.check(statuses.append)
+    assert statuses[-1] == RUNNING and pings(client) == 1
+    # A pong from before a ping does not answer it
+    liveness.forget()
+    liveness.check(statuses.append)
+    clock.tick()
+    assert statuses[-1] == NOT_RUNNING, statuses
+
+
+def check_stopped():
+    # The state the service sends as it stops is not cached as running
+    liveness, client, clock = start_liveness()
+    statuses = []
+    liveness.alive()
+    liveness.check(statuses.append)
+    assert statuses == [RUNNING] and pings(client) == 0
+    liveness.stopped()
+    liveness.alive()
+    liveness.check(statuses.append)
+    assert pings(client) == 1 and len(statuses) == 1
+    liveness.alive()
+    clock.tick()
+    assert statuses[-1] == NOT_RUNNING, statuses
+    # Once started again, its messages show it is running
+    liveness.forget()
+    liveness.alive()
+    liveness.check(statuses.append)
+    assert statuses[-1] == RUNNING and pings(client) == 1
+
+
+if __name__ == '__main__':
+    check_ttl()
+    check_timeout()
+    check_busy()
+    check_stalled_main_thread()
+    check_late_pong()
+    check_stopped()
+    print('Liveness checks passed')
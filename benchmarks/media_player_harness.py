@@ -0,0 +1,150 @@
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import standins
+standins.install()
+
+from android_media_player import AndroidMediaPlayer, IDLE, PREPARING, STARTED
+from standins import FakeJavaMediaPlayer
+
+##################################################################
+# Drives the real AndroidMediaPlayer against the MediaPlayer stand-in.
+# Checks that a new start replaces a prepare in progress, gapless
+# chaining, and recovery from prepare errors, then times a start and prepare cycle.
+#
+# The events Android would pass to the Player's thread are queued, and
+# run by drain().
+##################################################################
+
+MEDIA_URI = b'content://media/external/audio/media/'
+
+
+def uri(media_id):
+    return MEDIA_URI + str(media_id).encode()
+
+
+def start_media_player(gapless = True):
+    events = []
+    skips = []      # one entry per completion, or skip
+    player = AndroidMediaPlayer(gapless)
+    player.init_player(lambda: skips.append(1),
+                       lambda action, *args: events.append((action, args)))
+    player.events = events
+    player.skips = skips
+    return player
+
+
+def drain(player):
+    while player.events:
+        action, args = player.events.pop(0)
+        action(*args)
+
+
+def prepared(slot):
+    # The prepare completes, on Android's thread
+    slot.media_player.finish_prepare()
+
+
+def check_replace():
+    # Starts handled one at a time, each replaces the prepare in progress
+    player = start_media_player()
+    for i in range(3):
+        player.start(None, uri(i))
+        drain(player)
+        assert player.current.uri == uri(i)
+        assert player.current.state == PREPARING
+    prepared(player.current)
+    drain(player)
+    assert player.current.state == STARTED
+    # A prepared event queued before a new start is ignored
+    player.start(None, uri(3))
+    prepared(player.current)
+    player.start(None, uri(4))
+    drain(player)
+    assert player.current.uri == uri(4) and player.current.state == PREPARING
+    prepared(player.current)
+    drain(player)
+    assert player.current.state == STARTED
+
+
+def check_gapless():
+    player = start_media_player()
+    player.start(None, uri(0))
+    prepared(player.current)
+    drain(player)
+    player.prepare_next(None, uri(1))
+    prepared(player.next)
+    drain(player)
+    first = player.current.media_player
+    second = player.next.media_player
+    assert first.next_player is second
+    first.complete()
+    assert player.skips == [1] and second.state == 'started'
+    # The Player then starts the next track, which is already playing
+    player.start(None, uri(1))
+    assert player.current.media_player is second
+    assert player.current.state == STARTED and second.prepares == 1
+
+
+def check_errors():
+    FakeJavaMediaPlayer.bad_uris = {uri(9).decode()}
+    try:
+        # A track that fails to prepare is skipped
+        player = start_media_player()
+        player.start(None, uri(9))
+        prepared(player.current)
+        drain(player)
+        assert player.skips == [1], player.skips
+        assert player.current.state == IDLE
+        # and does not stop later tracks
+        player.start(None, uri(1))
+        prepared(player.current)
+        drain(player)
+        assert player.current.state == STARTED
+        # A next track that fails is not a completion
+        player.prepare_next(None, uri(9))
+        prepared(player.next)
+        drain(player)
+        assert player.skips == [1] and player.next.state == IDLE
+        assert player.current.media_player.next_player is None
+        assert player.current.state == STARTED
+        # An error from a track that is no longer wanted is ignored
+        player = start_media_player()
+        player.start(None, uri(9))
+        prepared(player.current)
+        player.start(None, uri(2))
+        drain(player)
+        assert player.skips == [] and player.current.uri == uri(2)
+        assert player.current.state == PREPARING
+        prepared(player.current)
+        drain(player)
+        assert player.current.state == STARTED
+    finally:
+        FakeJavaMediaPlayer.bad_uris = set()
+
+
+def run(count = 10000):
+    player = start_media_player()
+    start = perf_counter()
+    for i in range(count):
+        player.start(None, uri(i))
+        player.prepare_next(None, uri(i + 1))
+        prepared(player.current)
+        prepared(player.next)
+        drain(player)
+    elapsed = perf_counter() - start
+    return {'tracks': count, 'seconds': elapsed,
+            'tracks_per_second': count / elapsed}
+
+
+if __name__ == '__main__':
+    check_replace()
+    check_gapless()
+    check_errors()
+    print('Media player checks passed')
+    result = run()
+    print('{tracks} tracks started in {seconds:.3f} s, '
+          '{tracks_per_second:.0f} tracks/s'.format(**result))
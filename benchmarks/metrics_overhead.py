@@ -0,0 +1,50 @@
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+
+##################################################################
+# The cost of a timed() call, a span() and a count(), with metrics
+# disabled and enabled, over the cost of an empty function call.
+##################################################################
+
+REPEAT = 200000
+
+
+def per_call_ns(operation):
+    start = perf_counter()
+    for i in range(REPEAT):
+        operation()
+    return (perf_counter() - start) / REPEAT * 1e9
+
+
+def with_span():
+    with metrics.span('benchmark', 'span'):
+        pass
+
+
+def run():
+    def nothing():
+        pass
+    decorated = metrics.timed('benchmark.timed')(nothing)
+    counted = lambda: metrics.count('benchmark.count')
+    results = {}
+    base = per_call_ns(nothing)
+    for state in ['disabled', 'enabled']:
+        if state == 'enabled':
+            metrics.enable()
+        results[state] = {'timed_ns': per_call_ns(decorated) - base,
+                          'span_ns': per_call_ns(with_span) - base,
+                          'count_ns': per_call_ns(counted) - base}
+    metrics.disable()
+    metrics.reset()
+    return results
+
+
+if __name__ == '__main__':
+    for state, result in run().items():
+        print(state, ' '.join('{}={:.0f}'.format(k, v)
+                              for k, v in result.items()))
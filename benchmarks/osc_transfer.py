@@ -0,0 +1,89 @@
+import os
+import sys
+from multiprocessing import Process, Event
+from threading import Event as ThreadEvent
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from oscpy.client import OSCClient
+from oscpy.server import OSCThreadServer
+
+from playlist_transfer import PlaylistSender, PlaylistReceiver
+
+##################################################################
+# Playlist transfer throughput, between two local processes over OSC.
+# The receiver process plays the part of the service, this process the UI.
+##################################################################
+
+SENDER_PORT = 3102
+RECEIVER_PORT = 3100
+SIZES = [1000, 10000]
+
+
+def receiver_process(ready):
+    server = OSCThreadServer()
+    server.listen('localhost', port=RECEIVER_PORT, default=True)
+    client = OSCClient('localhost', SENDER_PORT)
+    receiver = PlaylistReceiver(client.send_message, lambda items, last: None)
+    server.bind(b'/playlist_chunk', receiver.chunk)
+    ready.set()
+    Event().wait()
+
+
+def uris(count):
+    return [('content://media/external/audio/media/' + str(i)).encode('utf8')
+            for i in range(count)]
+
+
+def transfer(sender, server, items):
+    chunks = len(sender.chunks(items))
+    done = ThreadEvent()
+    acked = set()
+
+    def ack(transfer_id, seq):
+        sender.ack(transfer_id, seq)
+        acked.add(seq)
+        if len(acked) == chunks:
+            done.set()
+
+    server.bind(b'/playlist_ack', ack)
+    start = perf_counter()
+    sender.send_playlist(items)
+    done.wait(30)
+    elapsed = perf_counter() - start
+    server.unbind(b'/playlist_ack', ack)
+    return {'seconds': elapsed, 'chunks': chunks,
+            'tracks_per_second': len(items) / elapsed,
+            'complete': done.is_set()}
+
+
+def run():
+    ready = Event()
+    receiver = Process(target=receiver_process, args=(ready,), daemon=True)
+    receiver.start()
+    ready.wait()
+    server = OSCThreadServer()
+    server.listen('localhost', port=SENDER_PORT, default=True)
+    client = OSCClient('localhost', RECEIVER_PORT)
+    sender = PlaylistSender(client.send_message)
+    results = {}
+    for count in SIZES:
+        # Content uris, and the media ids that replaced them
+        results[count] = {'uris': transfer(sender, server, uris(count)),
+                          'ids': transfer(sender, server,
+                                          list(range(count)))}
+    # Stop the listener before its socket is closed
+    server.terminate_server()
+    server.join_server()
+    server.stop_all()
+    receiver.terminate()
+    return results
+
+
+if __name__ == '__main__':
+    for count, result in run().items():
+        for kind, r in result.items():
+            print('{:6d} {:4s} {:3d} chunks {:8.3f} s {:10.0f} tracks/s'
+                  .format(count, kind, r['chunks'], r['seconds'],
+                          r['tracks_per_second']))
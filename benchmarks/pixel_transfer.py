@@ -0,0 +1,62 @@
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import standins
+standins.install()
+
+from mediastore_utils import pixel_buffer
+from standins import FakeBitmap, FakeBitmapUtil
+
+##################################################################
+# Album art pixels, from BitmapUtil.toPixels() to a texture sized
+# buffer, MB/s for each thumbnail resolution.
+#
+#   list   : pixel_buffer() of the list an old pyjnius returns
+#   bytes  : bytes() of the ByteArray, the previous copy
+#   view   : pixel_buffer() of the ByteArray, as decode_thumbnail() does
+#
+# toPixels() is the stand-in, it copies the bitmap's pixels as pyjnius
+# copies a Java byte[]. Each result is then copied into a texture sized
+# buffer, as blit_buffer() copies it. These are host memory copy rates,
+# not device rates, they show the copies each path makes.
+##################################################################
+
+RESOLUTIONS = [160, 300, 800]
+
+
+def transfer_rate(make, bitmap, repeat):
+    nbytes = bitmap.getWidth() * bitmap.getHeight() * 4
+    texture = memoryview(bytearray(nbytes))
+    start = perf_counter()
+    for i in range(repeat):
+        texture[:] = make(bitmap)
+    elapsed = perf_counter() - start
+    return nbytes * repeat / elapsed / 1e6
+
+
+def run(repeat = 20):
+    current = FakeBitmapUtil()
+    old = FakeBitmapUtil()
+    old.old_pyjnius = True
+    results = {}
+    for resolution in RESOLUTIONS:
+        bitmap = FakeBitmap(resolution, resolution)
+        results[resolution] = {
+            'list': transfer_rate(
+                lambda b: pixel_buffer(old.toPixels(b)), bitmap,
+                max(1, repeat // 10)),
+            'bytes': transfer_rate(
+                lambda b: bytes(current.toPixels(b)), bitmap, repeat),
+            'view': transfer_rate(
+                lambda b: pixel_buffer(current.toPixels(b)), bitmap, repeat)}
+    return results
+
+
+if __name__ == '__main__':
+    for resolution, rates in run().items():
+        print('{:4d}px '.format(resolution) +
+              '  '.join('{} {:10.1f} MB/s (host)'.format(k, v)
+                        for k, v in rates.items()))
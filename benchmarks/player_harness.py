@@ -0,0 +1,206 @@
+import os
+import sys
+from threading import Thread, Event
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from player import Player
+from metadata_cache import MetadataCache
+from playlist_transfer import PlaylistReceiver
+from fakes import FakeMediaPlayer, FakeClient, FakeServer
+
+##################################################################
+# Drives a Player with fake media player and OSC objects.
+# Checks the player's responses to a sequence of commands, then times
+# command handling.
+##################################################################
+
+
+def start_player(prefetch_window = 0):
+    media_player = FakeMediaPlayer()
+    client = FakeClient()
+    server = FakeServer()
+    lookups = []
+
+    def metadata(media_id):
+        lookups.append(media_id)
+        return 'Title ' + str(media_id), 'Artist'
+
+    player = Player(media_player, client, None, metadata = metadata,
+                    prefetch_window = prefetch_window)
+    player.lookups = lookups
+    player.bind(server)
+    thread = Thread(target=player.run, daemon=True)
+    thread.start()
+    return player, media_player, client, server, thread
+
+
+def sync(player):
+    # Wait until every message posted so far is processed
+    done = Event()
+    player.post(done.set)
+    done.wait(1)
+
+
+def last(client, address):
+    # The last message sent to address
+    return [m for m in client.messages if m[0] == address][-1]
+
+
+def state_fields(message):
+    # The fields of a /state message, as a dict
+    address, values = message
+    assert address == b'/state', address
+    return dict(zip(values[3::2], values[4::2]))
+
+
+def check():
+    player, media_player, client, server, thread = start_player()
+    uris = [b'content://media/external/audio/media/' + str(i).encode()
+            for i in range(3)]
+    server.send(b'/add_playlist', *uris)
+    server.send(b'/play')
+    server.send(b'/skip_next')
+    sync(player)
+    assert media_player.uri == uris[1], media_player.uri
+    media_player.complete()
+    sync(player)
+    assert media_player.uri == uris[2], media_player.uri
+    server.send(b'/skip_previous')
+    server.send(b'/skip_previous')
+    sync(player)
+    assert media_player.uri == uris[0], media_player.uri
+    server.send(b'/pause')
+    server.send(b'/play')
+    sync(player)
+    assert media_player.calls[-2:] == [('pause',), ('resume',)]
+    # A burst of skips starts only the last track
+    starts = len([c for c in media_player.calls if c[0] == 'start'])
+    # Hold the player while the skips are queued
+    player.post(sleep, 0.1)
+    for i in range(3):
+        server.send(b'/skip_next')
+    sync(player)
+    assert [c for c in media_player.calls if c[0] == 'start'][starts:] ==\
+        [('start', uris[0])], media_player.calls
+    # and looks up the metadata of only the last track
+    assert player.lookups[-2:] == [2, 0], player.lookups
+    assert state_fields(last(client, b'/state')) ==\
+        {b'media_id': 0, b'title': b'Title 0', b'position': 0}
+    # A UI that has seen the latest state is sent no fields
+    epoch, since, version = last(client, b'/state')[1][:3]
+    server.send(b'/service_state', epoch, version)
+    sync(player)
+    assert last(client, b'/state') == (b'/state', [epoch, version, version])
+    # A UI from before a restart is sent everything
+    server.send(b'/service_state', epoch + 1, version)
+    sync(player)
+    assert len(state_fields(last(client, b'/state'))) == 5
+    # Media ids in chunks, delivered in order
+    length = len(player.playlist)
+    server.send(b'/playlist_chunk', 7, 1, 2, 30, 31)
+    server.send(b'/playlist_chunk', 7, 0, 2, 20, 21)
+    sync(player)
+    assert list(player.playlist)[length:] == [20, 21, 30, 31]
+    # A busy player answers a ping, with its backlog and how long the
+    # current action has run
+    started = Event()
+    release = Event()
+
+    def hold():
+        started.set()
+        release.wait(1)
+    player.post(hold)
+    player.post(release.is_set)
+    started.wait(1)
+    sleep(0.05)
+    server.send(b'/ping')
+    release.set()
+    backlog, action_ms = last(client, b'/pong')[1]
+    assert backlog == 1 and action_ms >= 50, (backlog, action_ms)
+    sync(player)
+    server.send(b'/terminate')
+    thread.join(1)
+    assert not thread.is_alive()
+    assert state_fields(last(client, b'/state')) ==\
+        {b'media_id': -1, b'title': b'', b'artist': b'', b'length': 0}
+
+
+def check_metadata_cache():
+    lookups = []
+    generation = [0]
+
+    def lookup(media_id):
+        lookups.append(media_id)
+        return 'Title ' + str(media_id), 'Artist'
+
+    cache = MetadataCache(lookup, lambda: generation[0], max_entries = 2,
+                          check_interval = 0)
+    for media_id in [1, 2, 1, 2, 3, 1]:
+        cache(media_id)
+    # 3 evicts 1
+    assert lookups == [1, 2, 3, 1], lookups
+    generation[0] += 1
+    cache(1)
+    assert lookups[-1] == 1 and cache.stats()['invalidations'] == 1
+
+
+def check_transfer_expiry():
+    delivered = []
+    receiver = PlaylistReceiver(FakeClient().send_message,
+                                lambda items, last: delivered.append(items),
+                                expire = 0.05)
+    # The sender gave up before chunk 0 arrived
+    receiver.chunk(1, 1, 2, 11)
+    sleep(0.1)
+    receiver.chunk(2, 0, 1, 20)
+    assert receiver.transfers == {} and delivered == [(20,)], delivered
+    # and a late chunk of it is ignored
+    receiver.chunk(1, 0, 2, 10)
+    assert receiver.transfers == {} and delivered == [(20,)], delivered
+
+
+def check_prefetch():
+    player, media_player, client, server, thread = start_player(1)
+    uris = [b'content://media/external/audio/media/' + str(i).encode()
+            for i in range(10)]
+    server.send(b'/add_playlist', *uris)
+    server.send(b'/play')
+    sync(player)
+    assert last(client, b'/upcoming') == (b'/upcoming', [1, 9])
+    # Wait for the idle player to prefetch
+    sleep(0.1)
+    for i in range(5):
+        server.send(b'/skip_next')
+        sync(player)
+        sleep(0.05)
+    # Only the first track is not prefetched
+    assert player.prefetcher.stats()['hits'] == 5, player.prefetcher.stats()
+    server.send(b'/terminate')
+    thread.join(1)
+
+
+def run(count = 10000):
+    player, media_player, client, server, thread = start_player()
+    server.send(b'/add_playlist', *[str(i).encode() for i in range(100)])
+    server.send(b'/play')
+    start = perf_counter()
+    for i in range(count):
+        server.send(b'/skip_next')
+    server.send(b'/terminate')
+    thread.join()
+    elapsed = perf_counter() - start
+    return {'commands': count, 'seconds': elapsed,
+            'commands_per_second': count / elapsed}
+
+
+if __name__ == '__main__':
+    check()
+    check_metadata_cache()
+    check_transfer_expiry()
+    check_prefetch()
+    print('Player checks passed')
+    result = run()
+    print('{commands} skip_next in {seconds:.3f} s, '
+          '{commands_per_second:.0f} commands/s'.format(**result))
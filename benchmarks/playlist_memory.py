@@ -0,0 +1,68 @@
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playlist import Playlist, MEDIA_URI
+
+##################################################################
+# Playlist memory and operation times, compared with the list of
+# content uris it replaces.
+##################################################################
+
+SIZES = [1000, 10000, 100000]
+
+
+def list_bytes(uris):
+    return sys.getsizeof(uris) + sum(sys.getsizeof(u) for u in uris)
+
+
+def playlist_bytes(playlist):
+    return sys.getsizeof(playlist.ids) + sys.getsizeof(playlist.dense) +\
+        sys.getsizeof(playlist.sparse)
+
+
+def timed(operation, repeat = 100):
+    start = perf_counter()
+    for i in range(repeat):
+        operation(i)
+    return (perf_counter() - start) / repeat * 1e6    # microseconds
+
+
+def run():
+    results = {}
+    for size in SIZES:
+        ids = range(1000, 1000 + size)
+        uris = [MEDIA_URI + str(i).encode('utf8') for i in ids]
+        start = perf_counter()
+        playlist = Playlist(ids)
+        build = perf_counter() - start
+        middle = size // 2
+        last = 1000 + size - 1
+
+        def insert_remove(i):
+            playlist.insert(middle, last)
+            playlist.pop(middle)
+
+        def list_insert_remove(i):
+            uris.insert(middle, uris[-1])
+            uris.pop(middle)
+
+        results[size] = {
+            'list_bytes': list_bytes(uris),
+            'playlist_bytes': playlist_bytes(playlist),
+            'build_ms': build * 1e3,
+            'contains_us': timed(lambda i: last in playlist),
+            'list_contains_us': timed(lambda i: uris[-1] in uris),
+            'insert_remove_us': timed(insert_remove),
+            'list_insert_remove_us': timed(list_insert_remove),
+            'move_us': timed(lambda i: playlist.move(0, size - 1)),
+            'uri_us': timed(lambda i: playlist.uri(i % size))}
+    return results
+
+
+if __name__ == '__main__':
+    for size, result in run().items():
+        print(size, ' '.join('{}={:.1f}'.format(k, v)
+                             for k, v in result.items()))
@@ -0,0 +1,64 @@
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mediastore_catalog import Catalog, SQLiteSource
+from search_index import SearchIndex
+from library import library
+
+##################################################################
+# Search index build, incremental update, and per keystroke query
+# times, for a synthetic library in a SQLiteSource.
+##################################################################
+
+SIZES = [1000, 10000, 50000]
+
+
+def keystrokes(query):
+    return [query[:i] for i in range(1, len(query) + 1)]
+
+
+def run():
+    results = {}
+    for size in SIZES:
+        source = SQLiteSource()
+        source.create()
+        rows = library(size)
+        source.insert(rows)
+        catalog = Catalog().build(source)
+        index = SearchIndex()
+        start = perf_counter()
+        index.update(catalog.tracks())
+        build = perf_counter() - start
+        # Retitle 1% of the tracks
+        changed = [(r[0], 'Changed ' + r[1]) + r[2:] for r in rows[::100]]
+        source.insert(changed)
+        catalog = Catalog().build(source)
+        start = perf_counter()
+        added, removed = index.update(catalog.tracks())
+        update = perf_counter() - start
+        assert added == removed == len(changed)
+        # Type a title, and an artist then a title word
+        queries = keystrokes(rows[size // 2][1]) +\
+            keystrokes(rows[size // 3][5].split()[0] + ' ' +
+                       rows[size // 3][1].split()[0]) +\
+            keystrokes('changed')
+        times = []
+        for query in queries:
+            start = perf_counter()
+            index.search(query)
+            times.append(perf_counter() - start)
+        assert rows[size // 2][0] in index.search(rows[size // 2][1])
+        results[size] = {'build_ms': build * 1e3,
+                         'update_ms': update * 1e3,
+                         'query_mean_ms': sum(times) / len(times) * 1e3,
+                         'query_max_ms': max(times) * 1e3}
+    return results
+
+
+if __name__ == '__main__':
+    for size, result in run().items():
+        print(size, ' '.join('{}={:.2f}'.format(k, v)
+                             for k, v in result.items()))
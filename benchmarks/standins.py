@@ -0,0 +1,327 @@
+import os
+import sys
+import tempfile
+from types import ModuleType, SimpleNamespace
+
+from fakes import FakeCursor, FakeCursorDrain
+
+##################################################################
+# Stand-ins for the android and jnius modules, so that app modules can
+# be imported and timed on a desktop.
+#
+# install() must be called before an app module is imported. The
+# ContentResolver answers MediaStore queries from the 'audio' table of
+# the SQLiteSource connection given to use(), the table uses the
+# MediaStore column names. The MediaPlayer stand-in lets the real
+# AndroidMediaPlayer be driven, see media_player_harness.py.
+##################################################################
+
+MEDIA_URI = 'content://media/external/audio/media'
+GENRE_URI = 'content://media/external/audio/genres'
+
+
+class FakeUri():
+
+    def __init__(self, uri):
+        self.uri = uri
+
+    @staticmethod
+    def parse(uri):
+        if isinstance(uri, bytes):
+            uri = uri.decode('utf8')
+        return FakeUri(str(uri))
+
+    def toString(self):
+        return self.uri
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUri) and self.uri == other.uri
+
+    def __hash__(self):
+        return hash(self.uri)
+
+
+class FakeContentUris():
+
+    @staticmethod
+    def withAppendedId(uri, media_id):
+        return FakeUri(uri.uri + '/' + str(media_id))
+
+
+class FakeBundle(dict):
+
+    def putString(self, key, value):
+        self[key] = value
+
+    def putInt(self, key, value):
+        self[key] = value
+
+    def putStringArray(self, key, value):
+        self[key] = list(value)
+
+
+class FakeContentResolverClass():
+    QUERY_ARG_SQL_SELECTION = 'android:query-arg-sql-selection'
+    QUERY_ARG_SQL_SELECTION_ARGS = 'android:query-arg-sql-selection-args'
+    QUERY_ARG_SQL_SORT_ORDER = 'android:query-arg-sql-sort-order'
+    QUERY_ARG_SQL_GROUP_BY = 'android:query-arg-sql-group-by'
+    QUERY_ARG_LIMIT = 'android:query-arg-limit'
+    QUERY_ARG_OFFSET = 'android:query-arg-offset'
+
+
+class FakeContentResolver():
+    # query() as ContentResolver, with selection arguments or a Bundle
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.queries = 0
+
+    def query(self, uri, columns, selection = None, selection_args = None,
+              sort_order = None):
+        self.queries += 1
+        group_by = limit = offset = None
+        if isinstance(selection, FakeBundle):
+            args = selection
+            C = FakeContentResolverClass
+            selection = args.get(C.QUERY_ARG_SQL_SELECTION)
+            selection_args = args.get(C.QUERY_ARG_SQL_SELECTION_ARGS)
+            sort_order = args.get(C.QUERY_ARG_SQL_SORT_ORDER)
+            group_by = args.get(C.QUERY_ARG_SQL_GROUP_BY)
+            limit = args.get(C.QUERY_ARG_LIMIT)
+            offset = args.get(C.QUERY_ARG_OFFSET)
+        if uri.uri == GENRE_URI:
+            table = '(SELECT DISTINCT genre_id AS _id, genre AS name ' +\
+                'FROM audio WHERE genre IS NOT NULL)'
+        else:
+            table = 'audio'
+            if uri.uri.startswith(MEDIA_URI + '/'):
+                selection = '_id=' + uri.uri.rsplit('/', 1)[1]
+        sql = 'SELECT ' + ', '.join(columns) + ' FROM ' + table
+        if selection:
+            sql += ' WHERE ' + selection
+        if group_by:
+            sql += ' GROUP BY ' + group_by
+        if sort_order:
+            sql += ' ORDER BY ' + sort_order
+        if limit is not None:
+            sql += ' LIMIT ' + str(limit) + ' OFFSET ' + str(offset or 0)
+        return FakeCursor(self.connection, sql, selection_args or ())
+
+    def loadThumbnail(self, uri, size, signal):
+        # No album art
+        raise OSError('No thumbnail')
+
+
+class FakeContext():
+
+    def __init__(self, connection, directory):
+        self.resolver = FakeContentResolver(connection)
+        self.directory = directory
+
+    def getApplicationContext(self):
+        return self
+
+    def getContentResolver(self):
+        return self.resolver
+
+    def getPackageName(self):
+        return 'org.kivy.player'
+
+    def getCacheDir(self):
+        return self.path('cache')
+
+    def getFilesDir(self):
+        return self.path('files')
+
+    def path(self, name):
+        path = os.path.join(self.directory, name)
+        return SimpleNamespace(getAbsolutePath = lambda: path)
+
+
+class FakeMediaStore():
+    VOLUME_EXTERNAL = 'external'
+    connection = None
+
+    @classmethod
+    def getGeneration(cls, context, volume):
+        return cls.connection.total_changes
+
+
+class FakeMediaStoreConstants():
+    GENRE_TABLE = FakeUri(GENRE_URI)
+    MEDIA_TABLE = FakeUri(MEDIA_URI)
+    ID = '_id'
+    GENRE_NAME = 'name'
+    GENRE = 'genre'
+    GENRE_ID = 'genre_id'
+    ALBUM = 'album'
+    ALBUM_ID = 'album_id'
+    ALBUM_ARTIST = 'album_artist'
+    TITLE = 'title'
+    DISPLAY_NAME = '_display_name'
+    DATE_MODIFIED = 'date_modified'
+
+
+class FakeByteArray(bytearray):
+    # pyjnius' ByteArray, its copy of a Java byte[] is exposed as a buffer
+    pass
+
+
+class FakeBitmap():
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = bytes(width * height * 4)
+
+    def getWidth(self):
+        return self.width
+
+    def getHeight(self):
+        return self.height
+
+
+class FakeBitmapUtil():
+    # BitmapUtil. toPixels() returns the byte[] as pyjnius does, a
+    # ByteArray, or a list if old_pyjnius is set.
+    old_pyjnius = False
+
+    def toPixels(self, bitmap):
+        if self.old_pyjnius:
+            return list(bitmap.pixels)
+        return FakeByteArray(bitmap.pixels)
+
+
+class FakeListener():
+    # KivyCompletionListener, KivyPreparedListener and KivyErrorListener
+
+    def __init__(self, callback_wrapper):
+        self.callback_wrapper = callback_wrapper
+
+
+class FakeJavaMediaPlayer():
+    # android.media.MediaPlayer. A prepareAsync() completes when
+    # finish_prepare() is called, as Android would on its own thread.
+    # A data source in bad_uris fails to prepare.
+    bad_uris = set()
+
+    def __init__(self):
+        self.uri = None
+        self.state = 'idle'
+        self.next_player = None
+        self.prepares = 0
+        self.completion = self.prepared = self.error = None
+
+    def setOnCompletionListener(self, listener):
+        self.completion = listener
+
+    def setOnPreparedListener(self, listener):
+        self.prepared = listener
+
+    def setOnErrorListener(self, listener):
+        self.error = listener
+
+    def reset(self):
+        self.uri = None
+        self.state = 'idle'
+        self.next_player = None
+
+    def setDataSource(self, context, uri):
+        self.uri = uri.toString()
+
+    def prepareAsync(self):
+        self.state = 'preparing'
+        self.prepares += 1
+
+    def finish_prepare(self):
+        if self.state != 'preparing':
+            return
+        if self.uri in self.bad_uris:
+            self.state = 'error'
+            self._error()
+        else:
+            self.state = 'prepared'
+            self.prepared.callback_wrapper.on_prepared()
+
+    def start(self):
+        self.state = 'started'
+
+    def pause(self):
+        self.state = 'paused'
+
+    def stop(self):
+        self.state = 'stopped'
+
+    def isPlaying(self):
+        return self.state == 'started'
+
+    def setNextMediaPlayer(self, media_player):
+        self.next_player = media_player
+
+    def release(self):
+        self.state = 'released'
+
+    def complete(self):
+        # The end of the track, a chained player starts at once
+        self.state = 'completed'
+        if self.next_player:
+            self.next_player.state = 'started'
+        self.completion.callback_wrapper.on_completion()
+
+    def _error(self):
+        # Without an error listener Android reports a completion
+        if self.error:
+            self.error.callback_wrapper.on_error()
+        else:
+            self.completion.callback_wrapper.on_completion()
+
+
+CLASSES = {
+    'android.net.Uri': FakeUri,
+    'android.content.ContentUris': FakeContentUris,
+    'android.content.ContentResolver': FakeContentResolverClass,
+    'android.os.Bundle': FakeBundle,
+    'android.provider.MediaStore': FakeMediaStore,
+    'android.util.Size': lambda width, height: (width, height),
+    'org.kivy.player.MediaStoreConstants': FakeMediaStoreConstants,
+    'org.kivy.player.CursorDrain': FakeCursorDrain,
+    'org.kivy.player.BitmapUtil': FakeBitmapUtil,
+    'android.media.MediaPlayer': FakeJavaMediaPlayer,
+    'org.kivy.player.KivyCompletionListener': FakeListener,
+    'org.kivy.player.KivyPreparedListener': FakeListener,
+    'org.kivy.player.KivyErrorListener': FakeListener,
+}
+
+
+def autoclass(name):
+    try:
+        return CLASSES[name]
+    except KeyError:
+        raise ImportError('No stand-in for ' + name)
+
+
+_context = None
+
+
+def install(directory = None):
+    # Returns the FakeContext, as mActivity
+    global _context
+    if _context is None:
+        _context = FakeContext(None, directory or tempfile.mkdtemp())
+    jnius = ModuleType('jnius')
+    jnius.autoclass = autoclass
+    jnius.cast = lambda name, obj: obj
+    jnius.detach = lambda: None
+    jnius.PythonJavaClass = object
+    jnius.java_method = lambda signature: (lambda method: method)
+    android = ModuleType('android')
+    android.mActivity = _context
+    sys.modules['jnius'] = jnius
+    sys.modules['android'] = android
+    return _context
+
+
+def use(connection):
+    # The library for following queries
+    FakeMediaStore.connection = connection
+    _context.resolver.connection = connection
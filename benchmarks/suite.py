@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+from time import perf_counter
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+# App modules before benchmark modules
+sys.path.insert(0, BENCHMARKS)
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+import standins
+from library import library
+
+##################################################################
+# Runs the benchmarks on a desktop, and writes the results as JSON.
+#
+#   python benchmarks/suite.py [results.json]
+#
+# App modules run against the android and jnius stand-ins in
+# standins.py, with synthetic libraries from library.py. Kivy and oscpy
+# are not replaced, a benchmark that needs a package that is not
+# installed is recorded as skipped. No window or GL context is needed,
+# so the suite runs headless, for example with KIVY_WINDOW=mock.
+#
+# Compare the results files of two versions to find regressions.
+##################################################################
+
+SIZES = [1000, 10000, 50000]
+
+
+def timed(function, *args):
+    # Returns (result, milliseconds)
+    start = perf_counter()
+    result = function(*args)
+    return result, (perf_counter() - start) * 1e3
+
+
+def libraries():
+    from mediastore_catalog import SQLiteSource
+    for size in SIZES:
+        source = SQLiteSource()
+        source.create()
+        source.insert(library(size))
+        yield size, source
+
+
+def headless_mediastore_utils():
+    # A texture needs a GL context, album rows get a placeholder for the
+    # default album art.
+    import mediastore_utils
+    mediastore_utils._default_art = 'no_album_art'
+    return mediastore_utils
+
+
+def mediastore():
+    # The MediastoreUtils queries, from the MediaStore then the catalog
+    mediastore_utils = headless_mediastore_utils()
+    from mediastore_utils import MediastoreUtils
+    ms = MediastoreUtils()
+    results = {}
+    for size, source in libraries():
+        standins.use(source.connection)
+        genre_id = 0
+        album_id = 0
+        result = {}
+        for name in ['mediastore', 'catalog']:
+            if name == 'mediastore':
+                mediastore_utils._catalog = None
+            else:
+                _, result['catalog_build_ms'] = timed(ms._build_catalog)
+            result[name] = {
+                'genres_ms': timed(ms.list_genres)[1],
+                'albums_in_genre_ms':
+                timed(ms.list_albums_in_genre, genre_id)[1],
+                'tracks_in_album_ms':
+                timed(ms.list_tracks_in_album, album_id)[1],
+                'genre_track_ids_ms':
+                timed(ms.genre_track_ids, genre_id)[1]}
+        result['search_ms'] = timed(ms.search_tracks, 'the ka')[1]
+        results[size] = result
+    return results
+
+
+def picker_loading():
+    # A picker's page reads and text fitting, without the widgets
+    mediastore_utils = headless_mediastore_utils()
+    from mediastore_utils import MediastoreUtils
+    from string_lines import StringLines
+    ms = MediastoreUtils()
+    results = {}
+    for size, source in libraries():
+        standins.use(source.connection)
+        mediastore_utils._catalog = None
+        pages = ms.album_pages(0)
+        start = perf_counter()
+        albums, art_ids = next(pages)
+        StringLines().fit_data(albums, 'album_name', 16, 400, 2)
+        first_page = perf_counter() - start
+        for albums, art_ids in pages:
+            StringLines().fit_data(albums, 'album_name', 16, 400, 2)
+        results[size] = {'first_page_ms': first_page * 1e3,
+                         'all_pages_ms': (perf_counter() - start) * 1e3}
+    return results
+
+
+def string_lines():
+    from string_lines import StringLines
+    results = {}
+    for size in SIZES:
+        titles = [row[1] for row in library(size)]
+        sl = StringLines()
+        # Measured once, then memoized
+        _, cold = timed(sl.fit_many, titles, 16, 300, 2)
+        _, warm = timed(sl.fit_many, titles, 16, 300, 2)
+        results[size] = {'cold_ms': cold, 'warm_ms': warm}
+    return results
+
+
+def module_run(name):
+    # The run() of another benchmark module
+    return lambda: __import__(name).run()
+
+
+SUITE = {
+    'mediastore': mediastore,
+    'picker_loading': picker_loading,
+    'string_lines': string_lines,
+    'player': module_run('player_harness'),
+    'media_player': module_run('media_player_harness'),
+    'osc_playlist_transfer': module_run('osc_transfer'),
+    'albums_query': module_run('albums'),
+    'cursor_drain': module_run('cursor_drain'),
+    'search': module_run('search'),
+    'playlist': module_run('playlist_memory'),
+    'playlist_journal': module_run('journal'),
+    'pixel_transfer': module_run('pixel_transfer'),
+    'metrics_overhead': module_run('metrics_overhead'),
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              cwd = BENCHMARKS, capture_output = True,
+                              text = True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def run(path):
+    standins.install()
+    report = {'time': datetime.now(timezone.utc).isoformat(),
+              'commit': git_commit(),
+              'python': platform.python_version(),
+              'machine': platform.machine(),
+              'results': {}}
+    for name, benchmark in SUITE.items():
+        try:
+            result, elapsed = timed(benchmark)
+            print('{:24s} {:8.0f} ms'.format(name, elapsed))
+        except ImportError as e:
+            result = {'skipped': str(e)}
+            print('{:24s}  skipped, {}'.format(name, e))
+        except Exception as e:
+            result = {'error': repr(e)}
+            print('{:24s}  failed, {!r}'.format(name, e))
+        report['results'][name] = result
+    with open(path, 'w') as f:
+        json.dump(report, f, indent = 1, sort_keys = True)
+    return report
+
+
+if __name__ == '__main__':
+    run(sys.argv[1] if len(sys.argv) > 1 else
+        os.path.join(BENCHMARKS, 'results.json'))
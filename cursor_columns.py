@@ -0,0 +1,38 @@
+##################################################################
+# Reads the remaining rows of a Cursor as columns.
+#
+# With the Java CursorDrain the rows are read in one JNI call, and the
+# columns are copied to Python in bulk. Without it every row and
+# column is read with its own JNI call.
+# A null string is returned as ''.
+##################################################################
+
+def read_columns(cursor, long_columns, string_columns, drain_class = None):
+    # Returns a list of values for each of long_columns then
+    # string_columns.
+    if drain_class:
+        drain = drain_class(cursor, long_columns, string_columns)
+        rows = drain.rows
+        columns = [list(values[:rows]) for values in drain.longs]
+        for blob in drain.strings:
+            columns.append(_text(blob).split('\0')[:rows])
+        return columns
+    long_indexes = [cursor.getColumnIndex(c) for c in long_columns]
+    string_indexes = [cursor.getColumnIndex(c) for c in string_columns]
+    columns = [[] for c in long_indexes + string_indexes]
+    long_values = columns[:len(long_indexes)]
+    string_values = columns[len(long_indexes):]
+    while cursor.moveToNext():
+        for values, index in zip(long_values, long_indexes):
+            values.append(cursor.getLong(index))
+        for values, index in zip(string_values, string_indexes):
+            values.append(cursor.getString(index) or '')
+    return columns
+
+
+def _text(blob):
+    # A Java byte[] as str, older pyjnius returns a list of ints
+    try:
+        return bytes(memoryview(blob)).decode('utf8')
+    except TypeError:
+        return bytes(b & 0xff for b in blob).decode('utf8')
@@ -4,7 +4,8 @@ import android.graphics.Bitmap;
 import java.nio.ByteBuffer;
 import java.nio.IntBuffer;
 
-// This is probably only useful for small bitmaps
+// The pixels are copied once, into a Java byte[] that pyjnius exposes
+// to Python as a buffer.
 
 public class BitmapUtil {
 
@@ -12,10 +13,10 @@ public class BitmapUtil {
 	int width = bitmap.getWidth();
         int height= bitmap.getHeight();
 	
-	ByteBuffer buffer = ByteBuffer.allocateDirect(width * height * 4);
+	byte[] pixels = new byte[width * height * 4];
 	// copyPixelsToBuffer uses Bitmap internal RGBA not BGRA or ARGB
-	bitmap.copyPixelsToBuffer(buffer);
+	bitmap.copyPixelsToBuffer(ByteBuffer.wrap(pixels));
 	bitmap.recycle();
-	return buffer.array();
+	return pixels;
     }   
 }
@@ -3,4 +3,5 @@ package org.kivy.player;
 public interface CallbackWrapper {
     public void on_completion();
     public void on_error();
+    public void on_prepared();
 }
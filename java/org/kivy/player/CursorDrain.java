@@ -0,0 +1,55 @@
+package org.kivy.player;
+
+import android.database.Cursor;
+import java.io.ByteArrayOutputStream;
+import java.nio.charset.StandardCharsets;
+
+// Reads the remaining rows of a Cursor in one call from Python, rather
+// than JNI calls for every row and column.
+// Each long column is a long[]. Each string column is one byte[] of
+// UTF-8 values, each followed by a 0 byte, a null is empty.
+
+public class CursorDrain {
+    public int rows = 0;
+    public long[][] longs;
+    public byte[][] strings;
+
+    public CursorDrain(Cursor cursor, String[] longColumns,
+		       String[] stringColumns) {
+	int[] longIndexes = indexes(cursor, longColumns);
+	int[] stringIndexes = indexes(cursor, stringColumns);
+	int capacity = Math.max(0, cursor.getCount() - cursor.getPosition() - 1);
+	longs = new long[longColumns.length][capacity];
+	ByteArrayOutputStream[] blobs =
+	    new ByteArrayOutputStream[stringColumns.length];
+	for (int c = 0; c < blobs.length; c++) {
+	    blobs[c] = new ByteArrayOutputStream(capacity * 16);
+	}
+	while (rows < capacity && cursor.moveToNext()) {
+	    for (int c = 0; c < longIndexes.length; c++) {
+		longs[c][rows] = cursor.getLong(longIndexes[c]);
+	    }
+	    for (int c = 0; c < stringIndexes.length; c++) {
+		String value = cursor.getString(stringIndexes[c]);
+		if (value != null) {
+		    byte[] bytes = value.getBytes(StandardCharsets.UTF_8);
+		    blobs[c].write(bytes, 0, bytes.length);
+		}
+		blobs[c].write(0);
+	    }
+	    rows++;
+	}
+	strings = new byte[blobs.length][];
+	for (int c = 0; c < blobs.length; c++) {
+	    strings[c] = blobs[c].toByteArray();
+	}
+    }
+
+    private static int[] indexes(Cursor cursor, String[] columns) {
+	int[] indexes = new int[columns.length];
+	for (int c = 0; c < columns.length; c++) {
+	    indexes[c] = cursor.getColumnIndex(columns[c]);
+	}
+	return indexes;
+    }
+}
@@ -0,0 +1,20 @@
+package org.kivy.player;
+
+import android.media.MediaPlayer;
+import android.media.MediaPlayer.OnPreparedListener;
+import org.kivy.player.CallbackWrapper;
+
+
+public class KivyPreparedListener implements OnPreparedListener {
+
+    private CallbackWrapper callback_wrapper;
+
+    public KivyPreparedListener(CallbackWrapper callback_wrapper) {	
+	this.callback_wrapper = callback_wrapper;
+    }       
+
+    @Override
+    public void onPrepared (MediaPlayer mp) {
+	this.callback_wrapper.on_prepared();
+    }
+}
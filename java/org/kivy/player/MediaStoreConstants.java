@@ -17,4 +17,5 @@ public class MediaStoreConstants {
     public static final String ALBUM_ARTIST = MediaStore.MediaColumns.ALBUM_ARTIST;
     public static final String TITLE = MediaStore.MediaColumns.TITLE;
     public static final String DISPLAY_NAME = MediaStore.MediaColumns.DISPLAY_NAME;
+    public static final String DATE_MODIFIED = MediaStore.MediaColumns.DATE_MODIFIED;
 }
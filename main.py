@@ -1,6 +1,12 @@
+# First, so that every import is timed
+import startup_profile
+startup_profile.install()
+
+from importlib import import_module
+
 from kivy.app import App
 from kivy.metrics import sp
-from kivy.clock import mainthread
+from kivy.clock import Clock, mainthread
 from kivy.lang import Builder
 from kivy.logger import Logger
 from kivy.properties import StringProperty, ObjectProperty
@@ -8,15 +14,24 @@ from kivy.core.window import Window
 from kivy.core.image import Image as CoreImage
 
 from android import mActivity
-from jnius import autoclass, cast
+from jnius import autoclass
 
 from oscpy.client import OSCClient
 from oscpy.server import OSCThreadServer
 
 from android_permissions import AndroidPermissions
 from mediastore_utils import MediastoreUtils
-from music_picker import MusicPicker
 from string_lines import StringLines
+from playlist_transfer import PlaylistSender
+from service_liveness import ServiceLiveness, BUSY, NOT_RUNNING
+import metrics
+
+# The now-playing screen needs neither the music picker's KV rules nor
+# the MediaStore Java classes. With LAZY_START they are loaded after the
+# first frame, once IDLE_FRAMES frames pass without input, or on first
+# use. Else they are loaded before the first frame.
+LAZY_START = True
+IDLE_FRAMES = 30
 
 LAYOUT = """
 BoxLayout:
@@ -107,6 +122,14 @@ class ServiceMediaPlayer(App):
     def build(self, **args):
         self.show_pause = False
         self.granted = False
+        self.preloaded = False
+        # The last service state seen, see player_state.py
+        self.state_epoch = 0
+        self.state_version = 0
+        self.state = {}
+        # Album art prefetch, see Player.send_upcoming()
+        self.art_hits = 0
+        self.art_misses = 0
         self.kv = Builder.load_string(LAYOUT)
         return self.kv
 
@@ -120,14 +143,14 @@ class ServiceMediaPlayer(App):
 
     @mainthread
     def set_title(self, title):
-        title = StringLines().multiline_string(title, self.cols_24sp) 
+        title = StringLines().fit(title, sp(24), self.text_width(), bold = True)
         self.kv.ids.song_title.text = title
         rows = title.count('\n') + 1
         self.set_size_hints(rows)
 
     @mainthread
     def set_artist(self, artist):
-        artist = StringLines().multiline_string(artist, self.cols_16sp) 
+        artist = StringLines().fit(artist, sp(16), self.text_width())
         self.kv.ids.artist.text = artist
 
     @mainthread
@@ -136,6 +159,10 @@ class ServiceMediaPlayer(App):
             texture = CoreImage('icons/no_album_art.png').texture
         self.kv.ids.album_art.texture = texture        
         
+    def text_width(self):
+        # Leave a margin, the labels are the width of the Window
+        return round(Window.width * 0.95)
+
     def set_playlist(self, playlist_state):
         self.kv.ids.playlist.text = playlist_state
 
@@ -145,9 +172,14 @@ class ServiceMediaPlayer(App):
         self.kv.ids.artist.size_hint = (1, 1/3)
         self.kv.ids.padding.size_hint = (1, (2-off)/3)
         
-    @mainthread
-    def update_playlist_info(self, playlist_state):
-        self.set_playlist(playlist_state.decode('utf8'))
+    def update_playlist_info(self):
+        length = self.state.get('length', 0)
+        if length:
+            msg = 'Track ' + str(self.state.get('position', 0) + 1) +\
+                ' of ' + str(length) + ' in the Playlist.'
+        else:
+            msg = 'The Music Playlist is Empty.'
+        self.set_playlist(msg)
 
     ##################
     # App Lifecycle
@@ -155,23 +187,70 @@ class ServiceMediaPlayer(App):
     
     def on_start(self):
         self.set_album_art(None)
-        self.string_lines = StringLines()
-        self.cols_16sp = self.string_lines.estimate_columns(sp(16),Window.width)
-        self.cols_24sp = self.string_lines.estimate_columns(sp(24),Window.width)
         server = OSCThreadServer()
         server.listen(address=b'localhost', port=3002, default=True)
-        server.bind(b'/track_state', self.track_state)
-        server.bind(b'/playlist_state', self.update_playlist_info)
+        server.bind(b'/state', self.service_state)
+        server.bind(b'/upcoming', self.prefetch_art)
+        metrics.bind(server, 'ui')
         self.client = OSCClient(b'localhost', 3000)
+        self.playlist_sender = PlaylistSender(self.client.send_message)
+        server.bind(b'/playlist_ack', self.playlist_sender.ack)
+        self.liveness = ServiceLiveness(self.client.send_message)
+        # Answered on the OSC server thread, see service_liveness.py
+        server.bind(b'/pong', self.liveness.pong)
         self.dont_gc = AndroidPermissions(self.app_start)
+        startup_profile.after_first_frame(self.first_frame)
+        if not LAZY_START:
+            self.preload(0)
+
+    def first_frame(self):
+        startup_profile.report('first frame')
+        if LAZY_START:
+            self.quiet_frames = 0
+            Window.bind(on_motion=self.on_input)
+            Clock.schedule_interval(self.wait_for_idle, 0)
+        else:
+            startup_profile.finish()
+
+    def on_input(self, *args):
+        self.quiet_frames = 0
+
+    def wait_for_idle(self, dt):
+        # Called every frame, until there is no input for IDLE_FRAMES
+        self.quiet_frames += 1
+        if self.quiet_frames < IDLE_FRAMES:
+            return
+        Window.unbind(on_motion=self.on_input)
+        self.preload(dt)
+        return False
+
+    def preload(self, dt):
+        with metrics.span('app.preload'):
+            import_module('music_picker')
+            MediastoreUtils()
+        self.preloaded = True
+        if self.granted:
+            MediastoreUtils().refresh_catalog()
+        startup_profile.report('preload')
+        if LAZY_START:
+            startup_profile.finish()
 
     def app_start(self):
         self.dont_gc = None
         self.granted = True
         self.query_service_state()
+        if self.preloaded:
+            MediastoreUtils().refresh_catalog()
             
+    def on_pause(self):
+        Logger.info('Album art prefetch ' + str(self.art_hits) + ' hits ' +
+                    str(self.art_misses) + ' misses')
+        return True
+
     def on_resume(self):
         self.query_service_state()
+        if self.granted:
+            MediastoreUtils().refresh_catalog()
             
     ##################
     # Service State
@@ -181,45 +260,86 @@ class ServiceMediaPlayer(App):
         context =  mActivity.getApplicationContext()
         return str(context.getPackageName()) + '.Service' + 'Mediaplayer'
 
-    def service_is_running(self):
-        service_name = self.get_service_name()
-        context =  mActivity.getApplicationContext()
-        manager = cast('android.app.ActivityManager',
-                       mActivity.getSystemService(context.ACTIVITY_SERVICE))
-        for service in manager.getRunningServices(100):
-            if service.service.getClassName() == service_name:
-                return True
-        return False
-           
     def start_service_if_not_running(self):
-        if self.service_is_running():
+        self.liveness.check(self.start_service)
+
+    def start_service(self, status):
+        if status != NOT_RUNNING:
             return
         service = autoclass(self.get_service_name())
         service.start(mActivity,'round_music_note_white_24',
                       'Music Service','Started','')   
+        # Starting a started service does nothing, so a check before it
+        # answers may start it again.
+        self.liveness.forget()
 
     def query_service_state(self):
-        if self.service_is_running():
-            self.client.send_message(b'/service_state', [])
-        else:
+        self.liveness.check(self.query_running_service)
+
+    def query_running_service(self, status):
+        # The service replies with the changes since the state we have
+        if status == NOT_RUNNING:
             self.set_play()
             self.set_album_art(None)
+            return
+        if status == BUSY:
+            Logger.info('Music service is busy.')
+        self.client.send_message(b'/service_state',
+                                 [self.state_epoch, self.state_version])
 
     ##################
     # Track Metadata
     ##################
 
-    def track_state(self, encoded_uri):
-        uri = encoded_uri.decode('utf8')
-        if uri:
-            title, artist =\
-                MediastoreUtils().list_track_info(uri, self.set_album_art)
-            self.set_title(title)
-            self.set_artist(artist)
-        else:
-            self.set_title('')
-            self.set_artist('')
-            self.set_album_art(None)
+    @mainthread
+    def service_state(self, epoch, since, version, *fields):
+        # The fields that changed in the service state after version since
+        self.liveness.alive()
+        if epoch == self.state_epoch:
+            if version <= self.state_version:
+                # Out of order, or nothing new
+                return
+            if since > self.state_version:
+                # A change was lost, ask again
+                self.client.send_message(b'/service_state',
+                                         [epoch, self.state_version])
+                return
+        elif since:
+            self.client.send_message(b'/service_state', [0, 0])
+            return
+        self.state_epoch = epoch
+        self.state_version = version
+        changed = {}
+        for i in range(0, len(fields), 2):
+            value = fields[i + 1]
+            if isinstance(value, bytes):
+                value = value.decode('utf8')
+            changed[fields[i].decode('utf8')] = value
+        self.state.update(changed)
+        if 'title' in changed:
+            self.set_title(changed['title'])
+        if 'artist' in changed:
+            self.set_artist(changed['artist'])
+        if 'media_id' in changed:
+            # Only a new track needs its art
+            media_id = changed['media_id']
+            if media_id < 0:
+                self.set_album_art(None)
+            else:
+                if MediastoreUtils().has_thumbnail(media_id, 800):
+                    self.art_hits += 1
+                else:
+                    self.art_misses += 1
+                MediastoreUtils().add_thumbnail(self.set_album_art,
+                                                media_id, 800, 0)
+        if 'position' in changed or 'length' in changed:
+            self.update_playlist_info()
+
+    @mainthread
+    def prefetch_art(self, *media_ids):
+        # The tracks either side of the playing track
+        if self.granted:
+            MediastoreUtils().prefetch_thumbnails(self, media_ids, 800)
 
     ##################
     # UI Events
@@ -228,18 +348,19 @@ class ServiceMediaPlayer(App):
     def add_to_playlist(self):
         if self.granted:
             self.start_service_if_not_running()         
+            from music_picker import MusicPicker
             MusicPicker(self.picker_callback).open()
 
-    def picker_callback(self, uri_list):
-        encoded_uris = []
-        for uri in uri_list:
-            encoded_uris.append(uri.toString().encode('utf-8'))
-        if encoded_uris:
-            self.client.send_message(b'/add_playlist', encoded_uris)        
+    def picker_callback(self, track_ids):
+        # MediaStore ids, sent as OSC ints rather than content uris
+        if track_ids:
+            self.playlist_sender.send_playlist(track_ids)
 
     def terminate_service(self):
         if self.granted:
             self.client.send_message(b'/terminate', [])
+            # Its final /state does not show it is still running
+            self.liveness.stopped()
             self.set_play()
 
     def play_pause(self):
@@ -0,0 +1,180 @@
+from array import array
+
+##################################################################
+# An in-memory index of the audio MediaStore: genre -> albums -> tracks.
+#
+# The Catalog is built from one scan of a data source, and is not
+# modified after it is built, so a new Catalog is built and swapped in
+# when the MediaStore changes. Queries cost O(result).
+#
+# A data source has two methods:
+#   generation()  a value that changes when the media changes.
+#   scan()        yields (track_id, title, album_id, album, album_artist,
+#                 genre_id, genre, date_modified) ordered by album then
+#                 display name.
+#
+# ResolverSource (in mediastore_utils.py) reads the Android MediaStore,
+# SQLiteSource reads a stand-in table for use off device.
+##################################################################
+
+class Catalog():
+
+    def __init__(self, generation = None):
+        self.generation = generation
+        # Genres, sorted by name
+        self.genre_ids = array('q')
+        self.genre_names = []
+        self.genre_albums = []     # per genre, array of album indexes
+        self.genre_art = []        # per genre, per album, its first track
+                                   # index in the genre
+        self.genre_tracks = []     # per genre, array of track indexes
+        # Albums, in scan order
+        self.album_ids = array('q')
+        self.album_names = []
+        self.album_artists = []
+        self.album_tracks = []     # per album, array of track indexes
+        # Tracks, in scan order
+        self.track_ids = array('q')
+        self.track_titles = []
+        self.track_albums = array('l')   # per track, album index
+        self.track_modified = array('q')
+        # id -> index
+        self.genre_index = {}
+        self.album_index = {}
+        self.track_index = {}
+
+    def build(self, source):
+        self.generation = source.generation()
+        genres = {}    # genre_id -> (name, album indexes, art track
+                       # indexes, track indexes)
+        seen = set()   # (genre_id, album index)
+        for track_id, title, album_id, album, artist, genre_id, genre,\
+            modified in source.scan():
+            a = self.album_index.get(album_id)
+            if a is None:
+                a = len(self.album_ids)
+                self.album_index[album_id] = a
+                self.album_ids.append(album_id)
+                self.album_names.append(album or '')
+                self.album_artists.append(artist or '')
+                self.album_tracks.append(array('l'))
+            t = len(self.track_ids)
+            self.track_index[track_id] = t
+            self.track_ids.append(track_id)
+            self.track_titles.append(title or '')
+            self.track_albums.append(a)
+            self.track_modified.append(modified or 0)
+            self.album_tracks[a].append(t)
+            if genre is None or genre_id is None:
+                continue
+            if genre_id not in genres:
+                genres[genre_id] = (genre, array('l'), array('l'), array('l'))
+            if (genre_id, a) not in seen:
+                seen.add((genre_id, a))
+                genres[genre_id][1].append(a)
+                genres[genre_id][2].append(t)
+            genres[genre_id][3].append(t)
+        for genre_id in sorted(genres, key = lambda g: genres[g][0].casefold()):
+            name, albums, art, tracks = genres[genre_id]
+            self.genre_index[genre_id] = len(self.genre_ids)
+            self.genre_ids.append(genre_id)
+            self.genre_names.append(name)
+            self.genre_albums.append(albums)
+            self.genre_art.append(art)
+            self.genre_tracks.append(tracks)
+        return self
+
+    def genres(self):
+        return list(zip(self.genre_names, self.genre_ids))
+
+    def albums_in_genre(self, genre_id):
+        # Returns [(album_name, album_id, representative track_id)], the
+        # representative is the album's first track in the genre
+        g = self.genre_index.get(genre_id)
+        if g is None:
+            return []
+        return [(self.album_names[a], self.album_ids[a], self.track_ids[t])
+                for a, t in zip(self.genre_albums[g], self.genre_art[g])]
+
+    def tracks_in_album(self, album_id):
+        # Returns [(title, track_id)]
+        a = self.album_index.get(album_id)
+        if a is None:
+            return []
+        return [(self.track_titles[t], self.track_ids[t])
+                for t in self.album_tracks[a]]
+
+    def tracks_in_genre(self, genre_id):
+        # Returns [track_id] of the tracks in the genre, an album's other
+        # tracks are not included. In scan order, as the MediaStore query
+        # in MediastoreUtils.genre_track_ids().
+        g = self.genre_index.get(genre_id)
+        if g is None:
+            return []
+        return [self.track_ids[t] for t in self.genre_tracks[g]]
+
+    def album_info(self, album_id):
+        # Returns (album_name, album_artist, representative track_id)
+        a = self.album_index.get(album_id)
+        if a is None:
+            return None
+        return (self.album_names[a], self.album_artists[a],
+                self.track_ids[self.album_tracks[a][0]])
+
+    def tracks(self):
+        # Yields (track_id, title, album_name, album_artist)
+        for t, track_id in enumerate(self.track_ids):
+            a = self.track_albums[t]
+            yield (track_id, self.track_titles[t], self.album_names[a],
+                   self.album_artists[a])
+
+    def track_info(self, track_id):
+        # Returns (title, album_name, album_artist)
+        t = self.track_index.get(track_id)
+        if t is None:
+            return None
+        a = self.track_albums[t]
+        return (self.track_titles[t], self.album_names[a],
+                self.album_artists[a])
+
+    def modified(self, track_id):
+        t = self.track_index.get(track_id)
+        if t is None:
+            return None
+        return self.track_modified[t]
+
+
+class SQLiteSource():
+    # A stand-in for the audio MediaStore, the 'audio' table uses the
+    # MediaStore column names.
+
+    COLUMNS = ['_id', 'title', 'album_id', 'album', 'album_artist',
+               'genre_id', 'genre', 'date_modified']
+
+    def __init__(self, database = ':memory:'):
+        import sqlite3
+        self.connection = sqlite3.connect(database)
+
+    def create(self):
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS audio (_id INTEGER PRIMARY KEY, '
+            'title TEXT, _display_name TEXT, album_id INTEGER, album TEXT, '
+            'album_artist TEXT, genre_id INTEGER, genre TEXT, '
+            'date_modified INTEGER)')
+        self.connection.commit()
+
+    def insert(self, rows):
+        # rows are (_id, title, _display_name, album_id, album,
+        #           album_artist, genre_id, genre, date_modified)
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO audio VALUES (?,?,?,?,?,?,?,?,?)', rows)
+        self.connection.commit()
+
+    def generation(self):
+        version = self.connection.execute('PRAGMA data_version').fetchone()
+        return (version[0], self.connection.total_changes)
+
+    def scan(self):
+        return self.connection.execute(
+            'SELECT ' + ', '.join(self.COLUMNS) + ' FROM audio '
+            'ORDER BY album ASC, _display_name ASC')
@@ -1,119 +1,439 @@
+import os
 from kivy.clock import Clock
 from kivy.logger import Logger
 from kivy.core.image import Image as CoreImage
 from kivy.graphics.texture import Texture
 
 from android import mActivity
-from jnius import autoclass
+from jnius import autoclass, detach
 from functools import partial
+from itertools import chain
+from threading import Thread, Event
+from time import perf_counter
 
-Uri = autoclass('android.net.Uri')
-Size = autoclass('android.util.Size')
-ContentUris = autoclass('android.content.ContentUris')
+import metrics
+from mediastore_catalog import Catalog
+from cursor_columns import read_columns
+from search_index import SearchIndex
+from texture_cache import TextureCache
+from thumbnail_store import ThumbnailStore, release_pixels
+from thumbnail_loader import ThumbnailLoader
+
+# Java classes and MediaStoreConstants fields, resolved by the first
+# MediastoreUtils() rather than on import, see _load_classes().
+MediaStore = Size = ContentUris = ContentResolver = Bundle = None
+BitmapUtil = CursorDrain = None
+GENRE_TABLE = MEDIA_TABLE = None
+ID = GENRE_NAME = GENRE = GENRE_ID = ALBUM = ALBUM_ID = ALBUM_ARTIST =\
+    TITLE = DISPLAY_NAME = DATE_MODIFIED = None
 MS_FAIL = False
+_classes_loaded = False
+
+
+def _load_classes():
+    global MediaStore, Size, ContentUris, ContentResolver, Bundle
+    global BitmapUtil, CursorDrain, GENRE_TABLE, MEDIA_TABLE
+    global ID, GENRE_NAME, GENRE, GENRE_ID, ALBUM, ALBUM_ID, ALBUM_ARTIST
+    global TITLE, DISPLAY_NAME, DATE_MODIFIED, MS_FAIL, _classes_loaded
+    if _classes_loaded:
+        return
+    _classes_loaded = True
+    MediaStore = autoclass('android.provider.MediaStore')
+    Size = autoclass('android.util.Size')
+    ContentUris = autoclass('android.content.ContentUris')
+    ContentResolver = autoclass('android.content.ContentResolver')
+    Bundle = autoclass('android.os.Bundle')
+
+    try:
+        BitmapUtil = autoclass('org.kivy.player.BitmapUtil')
+    except Exception as e:
+        Logger.error("Idiot, you didn't include the java in the build.\n" +
+                     str(e))
+        MS_FAIL = True
+
+    try:
+        # Optional, without it cursors are read a row at a time
+        CursorDrain = autoclass('org.kivy.player.CursorDrain')
+    except Exception as e:
+        Logger.warning('CursorDrain is not available.\n' + str(e))
+        CursorDrain = None
+
+    try:
+        MediaStoreConstants = autoclass('org.kivy.player.MediaStoreConstants')
+        # Tables
+        GENRE_TABLE = MediaStoreConstants.GENRE_TABLE
+        MEDIA_TABLE = MediaStoreConstants.MEDIA_TABLE
+        # Columns
+        ID = MediaStoreConstants.ID
+        GENRE_NAME = MediaStoreConstants.GENRE_NAME
+        GENRE = MediaStoreConstants.GENRE
+        GENRE_ID = MediaStoreConstants.GENRE_ID
+        ALBUM = MediaStoreConstants.ALBUM
+        ALBUM_ID = MediaStoreConstants.ALBUM_ID
+        ALBUM_ARTIST = MediaStoreConstants.ALBUM_ARTIST
+        TITLE = MediaStoreConstants.TITLE
+        DISPLAY_NAME = MediaStoreConstants.DISPLAY_NAME
+        DATE_MODIFIED = MediaStoreConstants.DATE_MODIFIED
+    except Exception as e:
+        Logger.error('Device Mediastore configuration error.\n' + str(e))
+        MS_FAIL = True
+
+# Decoded album art, shared by every MediastoreUtils instance.
+# Keyed by (track_id, resolution), a 800 pixel texture is 2.5 MB.
+THUMBNAIL_CACHE_BYTES = 32 * 1024 * 1024
+thumbnail_cache = TextureCache(THUMBNAIL_CACHE_BYTES)
+# Cached in place of a texture when a track has no album art.
+_NO_ART = object()
+# Shown when there is no album art, loaded on first use.
+NO_ALBUM_ART = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'icons', 'no_album_art.png')
+_default_art = None
+# Decoded album art that survives a restart, in the app's cache directory.
+THUMBNAIL_STORE_BYTES = 64 * 1024 * 1024
+_thumbnail_store = None
+# Decodes album art on worker threads.
+_thumbnail_loader = None
+
+# The catalog is shared by every MediastoreUtils instance, it is
+# None until the first build completes.
+_catalog = None
+_catalog_building = False
+# Rows per page of a paged query
+PAGE_ROWS = 100
+# Updated from each new catalog.
+_search_index = SearchIndex()
+
+
+def pixel_buffer(java_bytes):
+    # A Java byte[] is returned by pyjnius as a ByteArray, which exposes
+    # its elements as a buffer, so Texture.blit_buffer() can read them
+    # without a copy. Older pyjnius returns a list.
+    try:
+        return memoryview(java_bytes)
+    except TypeError:
+        return bytes(java_bytes)
+
+
+class ResolverSource():
+    # Catalog data source, one scan of the MediaStore audio table.
+
+    def generation(self):
+        context =  mActivity.getApplicationContext()
+        return MediaStore.getGeneration(context, MediaStore.VOLUME_EXTERNAL)
+
+    def scan(self):
+        context =  mActivity.getApplicationContext()
+        with metrics.span('mediastore.query'):
+            cursor = context.getContentResolver().query(
+                MEDIA_TABLE, [ID, ALBUM_ID, GENRE_ID, DATE_MODIFIED, TITLE,
+                              ALBUM, ALBUM_ARTIST, GENRE], None, None,
+                ALBUM + ' ASC, ' + DISPLAY_NAME + ' ASC')
+        if not cursor:
+            return
+        try:
+            with metrics.span('mediastore.read'):
+                ids, album_ids, genre_ids, modified, titles, albums, artists,\
+                    genres = read_columns(
+                        cursor, [ID, ALBUM_ID, GENRE_ID, DATE_MODIFIED],
+                        [TITLE, ALBUM, ALBUM_ARTIST, GENRE], CursorDrain)
+        finally:
+            cursor.close()
+        for i, genre in enumerate(genres):
+            yield (ids[i], titles[i], album_ids[i], albums[i], artists[i],
+                   genre_ids[i] if genre else None, genre or None,
+                   modified[i])
 
-try:
-    BitmapUtil = autoclass('org.kivy.player.BitmapUtil')
-except Exception as e:
-    Logger.error("Idiot, you didn't include the java in the build.\n" + str(e))
-    MS_FAIL = True
-
-try:
-    MediaStoreConstants = autoclass('org.kivy.player.MediaStoreConstants')
-    # Tables
-    GENRE_TABLE = MediaStoreConstants.GENRE_TABLE
-    MEDIA_TABLE = MediaStoreConstants.MEDIA_TABLE
-    # Columns
-    ID = MediaStoreConstants.ID
-    GENRE_NAME = MediaStoreConstants.GENRE_NAME
-    GENRE = MediaStoreConstants.GENRE
-    GENRE_ID = MediaStoreConstants.GENRE_ID
-    ALBUM = MediaStoreConstants.ALBUM
-    ALBUM_ID = MediaStoreConstants.ALBUM_ID
-    ALBUM_ARTIST = MediaStoreConstants.ALBUM_ARTIST
-    TITLE = MediaStoreConstants.TITLE
-    DISPLAY_NAME = MediaStoreConstants.DISPLAY_NAME
-except Exception as e:
-    Logger.error('Device Mediastore configuration error.\n' + str(e))
-    MS_FAIL = True
 
 class MediastoreUtils():
 
+    def __init__(self):
+        _load_classes()
+
+    def available(self):
+        return not MS_FAIL
+
+    ##################
+    # Catalog
+    ##################
+
+    def refresh_catalog(self):
+        # Rebuild the catalog in the background if the MediaStore changed.
+        # Until the build completes, queries go to the MediaStore.
+        global _catalog_building
+        if MS_FAIL or _catalog_building:
+            return
+        try:
+            generation = ResolverSource().generation()
+        except Exception as e:
+            Logger.error('Mediastore Generation error.\n' + str(e))
+            return
+        if _catalog and _catalog.generation == generation:
+            return
+        _catalog_building = True
+        Thread(target=self._build_catalog, daemon=True).start()
+
+    @metrics.timed('catalog.build')
+    def _build_catalog(self):
+        global _catalog, _catalog_building
+        try:
+            previous = _catalog
+            _catalog = Catalog().build(ResolverSource())
+            if previous:
+                Clock.schedule_once(partial(self.invalidate_thumbnails,
+                                            previous, _catalog))
+            _search_index.update(_catalog.tracks())
+        except Exception as e:
+            Logger.error('Mediastore Catalog error.\n' + str(e))
+        finally:
+            _catalog_building = False
+            detach()
+
+    ##################
+    # Queries
+    ##################
+
     def id_to_uri(self, ms_id):
         return ContentUris.withAppendedId(MEDIA_TABLE, ms_id)
     
+    @metrics.timed('mediastore.list_genres')
     def list_genres(self):
+        return list(chain.from_iterable(self.genre_pages()))
+
+    @metrics.timed('mediastore.list_albums_in_genre')
+    def list_albums_in_genre(self, genre_id):
         results = []
+        art_ids = []
+        for albums, arts in self.album_pages(genre_id):
+            results += albums
+            art_ids += arts
+        return results, art_ids
+
+    @metrics.timed('mediastore.list_tracks_in_album')
+    def list_tracks_in_album(self, album_id):
+        return list(chain.from_iterable(self.track_pages(album_id)))
+
+    @metrics.timed('mediastore.genre_track_ids')
+    def genre_track_ids(self, genre_id):
+        # Every track in the genre, in picker order, from one query
+        if _catalog:
+            return _catalog.tracks_in_genre(genre_id)
+        return self.query_track_ids(GENRE_ID + '=' + str(genre_id),
+                                    ALBUM + ' ASC, ' + DISPLAY_NAME + ' ASC')
+
+    @metrics.timed('mediastore.album_track_ids')
+    def album_track_ids(self, album_id):
+        # Every track in the album, in picker order, from one query
+        if _catalog:
+            return [track_id for title, track_id in
+                    _catalog.tracks_in_album(album_id)]
+        return self.query_track_ids(ALBUM_ID + '=' + str(album_id),
+                                    DISPLAY_NAME + ' ASC')
+
+    def query_track_ids(self, selection, sort_order):
+        ids = []
         try:
-            columns = [GENRE_NAME, ID]
             context =  mActivity.getApplicationContext()
             cursor = context.getContentResolver().query(
-                GENRE_TABLE, columns, None, None, GENRE_NAME + " ASC")
-            genre_index = cursor.getColumnIndex(GENRE_NAME)
-            id_index = cursor.getColumnIndex(ID)
-            while cursor and cursor.moveToNext():
-                genre_name = str(cursor.getString(genre_index))
-                if genre_name != 'None':
-                    results.append({'genre_name': genre_name,
-                                    'genre_id': cursor.getLong(id_index)})
+                MEDIA_TABLE, [ID], selection, None, sort_order)
             if cursor:
-                cursor.close()
+                try:
+                    ids, = read_columns(cursor, [ID], [], CursorDrain)
+                finally:
+                    cursor.close()
         except Exception as e:
-            Logger.error('Mediastore Genres error.\n' + str(e))
-        return results
+            Logger.error('Mediastore Track Ids error.\n' + str(e))
+        return ids
 
-    def list_albums_in_genre(self, genre_id):
-        results = []
-        art_ids = []
+    ##################
+    # Paged Queries
+    ##################
+
+    # The *_pages() generators yield the results of the list_*() queries
+    # a page at a time. From the MediaStore each page is one query, with
+    # a limit, see query_pages(), so the first page is available
+    # without reading every row.
+
+    def genre_pages(self, page_rows = PAGE_ROWS):
+        if _catalog:
+            genres = [{'genre_name': name, 'genre_id': genre_id}
+                      for name, genre_id in _catalog.genres()]
+            yield from self.pages(genres, page_rows)
+            return
+        def read(cursor):
+            ids, names = read_columns(cursor, [ID], [GENRE_NAME], CursorDrain)
+            return [{'genre_name': name, 'genre_id': genre_id}
+                    for genre_id, name in zip(ids, names) if name]
         try:
-            columns = [ID, ALBUM, ALBUM_ID, GENRE_ID] 
-            selection = GENRE_ID + '=' + str(genre_id)
-            context =  mActivity.getApplicationContext()
-            resolver = context.getContentResolver()
-            cursor = resolver.query(MEDIA_TABLE, columns, selection,
-                                    None, ALBUM + " ASC")
-            id_index = cursor.getColumnIndex(ID)
-            album_index = cursor.getColumnIndex(ALBUM)
-            album_id_index = cursor.getColumnIndex(ALBUM_ID)
-            default_texture = CoreImage('icons/no_album_art.png').texture
-            previous_album_name = ''
-            index = 0
-            while cursor and cursor.moveToNext():
-                album_name = cursor.getString(album_index)
-                # Can't get MediaStore to use DISCRETE, so filter by name.
-                if album_name != previous_album_name:
-                    art_ids.append((index, cursor.getLong(id_index)))
-                    index += 1
+            yield from self.query_pages(GENRE_TABLE, [GENRE_NAME, ID], None,
+                                        GENRE_NAME, ID, read, page_rows)
+        except Exception as e:
+            Logger.error('Mediastore Genres error.\n' + str(e))
+
+    def album_pages(self, genre_id, page_rows = PAGE_ROWS):
+        # Yields (albums, [(index, track_id)]), index is in all the albums
+        default_texture = self.default_art()
+        if _catalog:
+            albums = _catalog.albums_in_genre(genre_id)
+            for first in range(0, len(albums), page_rows):
+                results = []
+                art_ids = []
+                for index, (album_name, album_id, track_id) in\
+                    enumerate(albums[first:first + page_rows], first):
+                    art_ids.append((index, track_id))
                     results.append({'album_name': album_name,
                                     'album_art': default_texture,
-                                    'album_id': cursor.getLong(album_id_index)})
-                previous_album_name = album_name
-            if cursor:
-                cursor.close()
+                                    'album_id': album_id})
+                yield results, art_ids
+            return
+        # One row per album, from any one of its tracks in the genre.
+        # The index carries over between pages.
+        state = {'index': 0}
+        def read(cursor):
+            ids, album_ids, names = read_columns(cursor, [ID, ALBUM_ID],
+                                                 [ALBUM], CursorDrain)
+            first = state['index']
+            state['index'] += len(ids)
+            art_ids = list(enumerate(ids, first))
+            results = [{'album_name': name, 'album_art': default_texture,
+                        'album_id': album_id}
+                       for album_id, name in zip(album_ids, names)]
+            return results, art_ids
+        try:
+            columns = [ID, ALBUM, ALBUM_ID]
+            selection = GENRE_ID + '=' + str(genre_id)
+            yield from self.query_pages(MEDIA_TABLE, columns, selection,
+                                        ALBUM, ALBUM_ID, read, page_rows,
+                                        group_by = ALBUM_ID)
         except Exception as e:
             Logger.error('Mediastore Albums error.\n' + str(e))
-        return results, art_ids
 
-    def list_tracks_in_album(self, album_id):
-        results = []
+    def track_pages(self, album_id, page_rows = PAGE_ROWS):
+        if _catalog:
+            tracks = [{'track_name': title, 'track_id': track_id}
+                      for title, track_id in _catalog.tracks_in_album(album_id)]
+            yield from self.pages(tracks, page_rows)
+            return
+        def read(cursor):
+            ids, titles = read_columns(cursor, [ID], [TITLE], CursorDrain)
+            return [{'track_name': title, 'track_id': track_id}
+                    for track_id, title in zip(ids, titles)]
         try:
             columns = [ID, ALBUM_ID, TITLE, DISPLAY_NAME]
             selection = ALBUM_ID + '=' + str(album_id)  
-            context =  mActivity.getApplicationContext()
-            cursor = context.getContentResolver().query(
-                MEDIA_TABLE, columns, selection, None, DISPLAY_NAME + ' ASC')
-            title_index = cursor.getColumnIndex(TITLE)
-            id_index = cursor.getColumnIndex(ID)
-            while cursor and cursor.moveToNext():
-                results.append({'track_name': cursor.getString(title_index),
-                                'track_id': cursor.getLong(id_index)})
-            if cursor:
-                cursor.close()
+            yield from self.query_pages(MEDIA_TABLE, columns, selection,
+                                        DISPLAY_NAME, ID, read, page_rows)
         except Exception as e:
             Logger.error('Mediastore Track error.\n' + str(e))          
-        return results
-    
+
+    def pages(self, results, page_rows):
+        for first in range(0, len(results), page_rows):
+            yield results[first:first + page_rows]
+
+    def query_pages(self, table, columns, selection, sort_column,
+                    key_column, read, page_rows, group_by = None):
+        # Yields read(cursor) for each page of the query, in sort_column
+        # then key_column order. Both must be in columns, and key_column
+        # unique in the results.
+        # A page starts after the last row of the previous page, rather
+        # than at an offset, so the provider does not rescan the earlier
+        # pages for each page. A NULL sort value is sorted and compared
+        # as '', as no value compares equal to NULL.
+        context =  mActivity.getApplicationContext()
+        resolver = context.getContentResolver()
+        sort_value = 'IFNULL(' + sort_column + ", '')"
+        sort_order = sort_value + ' ASC, ' + key_column + ' ASC'
+        after = '(' + sort_value + ' > ? OR (' + sort_value + ' = ? AND ' +\
+            key_column + ' > ?))'
+        last = None
+        while True:
+            query_args = Bundle()
+            if last is None:
+                page_selection = selection
+            else:
+                page_selection = '(' + selection + ') AND ' + after\
+                    if selection else after
+                query_args.putStringArray(
+                    ContentResolver.QUERY_ARG_SQL_SELECTION_ARGS,
+                    [last[0], last[0], str(last[1])])
+            if page_selection:
+                query_args.putString(ContentResolver.QUERY_ARG_SQL_SELECTION,
+                                     page_selection)
+            if group_by:
+                query_args.putString(ContentResolver.QUERY_ARG_SQL_GROUP_BY,
+                                     group_by)
+            query_args.putString(ContentResolver.QUERY_ARG_SQL_SORT_ORDER,
+                                 sort_order)
+            query_args.putInt(ContentResolver.QUERY_ARG_LIMIT, page_rows)
+            with metrics.span('mediastore.query'):
+                cursor = resolver.query(table, columns, query_args, None)
+            if not cursor:
+                return
+            try:
+                rows = cursor.getCount()
+                with metrics.span('mediastore.read'):
+                    page = read(cursor)
+                if rows and cursor.moveToLast():
+                    last = (cursor.getString(
+                                cursor.getColumnIndex(sort_column)) or '',
+                            cursor.getLong(cursor.getColumnIndex(key_column)))
+                metrics.count('mediastore.rows', rows)
+            finally:
+                cursor.close()
+            yield page
+            if rows < page_rows:
+                return
+
+    def load_pages(self, pages, page_callback, name):
+        # The first page is read now, the others on a new thread.
+        # page_callback(page) is called on the main thread for each page.
+        # Returns an Event, set it to stop reading.
+        stop = Event()
+        start = perf_counter()
+        first = next(pages, None)
+        first_time = perf_counter() - start
+        if first is not None:
+            page_callback(first)
+            Thread(target=self._load_pages,
+                   args=(pages, page_callback, name, stop, start, first_time),
+                   daemon=True).start()
+        return stop
+
+    def _load_pages(self, pages, page_callback, name, stop, start,
+                    first_time):
+        try:
+            for page in pages:
+                if stop.is_set():
+                    break
+                Clock.schedule_once(partial(self._deliver_page, page_callback,
+                                            stop, page))
+        except Exception as e:
+            Logger.error('Mediastore ' + name + ' error.\n' + str(e))
+        finally:
+            detach()
+        Logger.info('Mediastore ' + name + ' first page {:.0f} ms, all pages '
+                    '{:.0f} ms'.format(first_time * 1e3,
+                                       (perf_counter() - start) * 1e3))
+
+    def _deliver_page(self, page_callback, stop, page, dt):
+        if not stop.is_set():
+            page_callback(page)
+
+    @metrics.timed('mediastore.list_album_info')
     def list_album_info(self, art_callback, album_id):
+        track_id = None
+        album = ''
+        artist = ''
+        info = _catalog.album_info(album_id) if _catalog else None
+        if info:
+            album, artist, track_id = info
+        else:
+            album, artist, track_id = self._query_album_info(album_id)
+        if track_id:
+            Clock.schedule_once(partial(self.add_thumbnail, art_callback,
+                                        track_id, 300), 0.1)    
+        return album, artist
+
+    def _query_album_info(self, album_id):
         track_id = None
         album = ''
         artist = ''
@@ -134,85 +454,165 @@ class MediastoreUtils():
                 cursor.close()
         except Exception as e:
             Logger.error('Mediastore Album Info error.\n' + str(e))
-        if track_id:
-            Clock.schedule_once(partial(self.add_thumbnail, art_callback,
-                                        track_id, 300), 0.1)    
-        return album, artist
+        return album, artist, track_id
 
-    def list_track_info(self, track_uri_string, art_callback):
-        track_name = ''
-        artist_name = ''
-        track_id = None
-        try: 
-            track_uri = Uri.parse(track_uri_string)
-            columns = [ID, TITLE, ALBUM_ARTIST]
-            context =  mActivity.getApplicationContext()
-            resolver = context.getContentResolver()
-            cursor = resolver.query(track_uri, columns, None, None, None)
-            title_index = cursor.getColumnIndex(TITLE)
-            artist_index = cursor.getColumnIndex(ALBUM_ARTIST)
-            id_index = cursor.getColumnIndex(ID)
+    @metrics.timed('mediastore.search_tracks')
+    def search_tracks(self, query, limit = 200):
+        # Tracks with title, album, or album artist matching query.
+        # Until the catalog is built there are no results.
+        results = []
+        if _catalog:
+            for track_id in _search_index.search(query, limit):
+                info = _catalog.track_info(track_id)
+                if info:
+                    title, album, artist = info
+                    results.append({'track_name': title + ' - ' + album,
+                                    'track_id': track_id})
+        return results
+
+    ##################
+    # Thumbnails
+    ##################
+
+    def thumbnail_store(self):
+        global _thumbnail_store
+        if _thumbnail_store is None:
+            cache_dir = mActivity.getCacheDir().getAbsolutePath()
+            _thumbnail_store = ThumbnailStore(cache_dir + '/thumbnails',
+                                              THUMBNAIL_STORE_BYTES)
+        return _thumbnail_store
+
+    def modified(self, resolver, track_id):
+        # The track's modification stamp, from the catalog if possible.
+        modified = _catalog.modified(track_id) if _catalog else None
+        if modified is not None:
+            return modified
+        modified = 0
+        try:
+            track_uri = ContentUris.withAppendedId(MEDIA_TABLE, track_id)
+            cursor = resolver.query(track_uri, [DATE_MODIFIED],
+                                    None, None, None)
             if cursor and cursor.moveToFirst():
-                track_name = cursor.getString(title_index)
-                artist_name = cursor.getString(artist_index)  
-                track_id = cursor.getLong(id_index)
+                modified = cursor.getLong(0)
             if cursor:
                 cursor.close()
         except Exception as e:
-            Logger.error('Mediastore Track Info error.\n' + str(e))
-        if track_id:
-            Clock.schedule_once(partial(self.add_thumbnail, art_callback,
-                                        track_id, 800), 0.1) 
-        return track_name, artist_name
+            Logger.error('Mediastore Date Modified error.\n' + str(e))
+        return modified
 
+    def invalidate_thumbnails(self, previous, catalog, dt):
+        # Drop cached art of tracks that changed, or were removed, since
+        # the previous catalog.
+        for key in thumbnail_cache.keys():
+            if catalog.modified(key[0]) != previous.modified(key[0]):
+                thumbnail_cache.remove(key)
 
-    def add_thumbnail(self, art_callback, track_id, size, dt):
-        thumbnail_size = Size(size, size)
+    def texture_from_pixels(self, size, pixels):
+        texture = Texture.create(size, colorfmt='rgba')
+        texture.flip_vertical()
+        texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+        return texture
+
+    def thumbnail_loader(self):
+        global _thumbnail_loader
+        if _thumbnail_loader is None:
+            _thumbnail_loader = ThumbnailLoader(self.decode_thumbnail,
+                                                self.deliver_thumbnail)
+        return _thumbnail_loader
+
+    @metrics.timed('thumbnail.decode')
+    def decode_thumbnail(self, track_id, resolution):
+        # Runs on a ThumbnailLoader worker, look on disk, then decode.
+        # Returns ((width, height), pixels) or None
+        context =  mActivity.getApplicationContext()
+        resolver = context.getContentResolver()
+        modified = self.modified(resolver, track_id)
+        stored = self.thumbnail_store().get(track_id, resolution, modified)
+        if stored:
+            metrics.count('thumbnail.store_hits')
+            return stored
+        thumbnail_size = Size(resolution, resolution)
         track_uri = ContentUris.withAppendedId(MEDIA_TABLE, track_id)
         try:
-            context =  mActivity.getApplicationContext()
-            resolver = context.getContentResolver()
             bitmap = resolver.loadThumbnail(track_uri, thumbnail_size, None)
         except Exception as e:
             # File not found
             bitmap = None
-        if bitmap:
-            size = (bitmap.getWidth(), bitmap.getHeight())
-            pixels = bytes(BitmapUtil().toPixels(bitmap))
-            texture = Texture.create(size, colorfmt='rgba')
-            texture.flip_vertical()
-            texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+        if not bitmap:
+            return None
+        size = (bitmap.getWidth(), bitmap.getHeight())
+        pixels = pixel_buffer(BitmapUtil().toPixels(bitmap))
+        self.thumbnail_store().put(track_id, resolution, modified, size, pixels)
+        return size, pixels
+
+    @metrics.timed('thumbnail.upload')
+    def deliver_thumbnail(self, track_id, resolution, decoded):
+        # Runs on the main thread, returns a texture or None.
+        key = (track_id, resolution)
+        if decoded is None:
+            # A nominal size, so that misses are also evicted
+            thumbnail_cache.put(key, _NO_ART, 64)
+            return None
+        texture = self.texture_from_pixels(*decoded)
+        release_pixels(decoded[1])
+        thumbnail_cache.put(key, texture)
+        return texture
+
+    @metrics.timed('thumbnail.add')
+    def add_thumbnail(self, art_callback, track_id, size, dt):
+        texture = thumbnail_cache.get((track_id, size))
+        metrics.count('thumbnail.cache_misses' if texture is None else
+                      'thumbnail.cache_hits')
+        if texture is None:
+            self.thumbnail_loader().request(
+                None, [(None, track_id, size)],
+                lambda tag, texture: self.add_thumbnail_done(art_callback,
+                                                             texture))
         else:
-            texture = CoreImage('icons/no_album_art.png').texture
+            self.add_thumbnail_done(art_callback, texture)
+
+    def add_thumbnail_done(self, art_callback, texture):
+        if texture is None or texture is _NO_ART:
+            texture = self.default_art()
         art_callback(texture)
         
-    def add_many_thumbnails(self, art_callback, track_ids, resolution, dt):
-        context =  mActivity.getApplicationContext()
-        resolver = context.getContentResolver()       
-        # Visible thumbnails are never updated by RV so we set the first 14 now.
-        # 14 is a guess, of the number of instances first visible
-        # The remainder are scheduled in chunks
-        now = track_ids[:14]
-        later = track_ids[14:]
-        thumbnail_size = Size(resolution, resolution)
-        for track_id in now:
-            index = track_id[0]
-            tid   = track_id[1]
-            track_uri = ContentUris.withAppendedId(MEDIA_TABLE, tid)
-            try:
-                bitmap = resolver.loadThumbnail(track_uri, thumbnail_size, None)
-            except Exception as e:
-                # File not found
-                bitmap = None
-            if bitmap:
-                size = (bitmap.getWidth(), bitmap.getHeight())
-                pixels = bytes(BitmapUtil().toPixels(bitmap))
-                texture = Texture.create(size, colorfmt='rgba')
-                texture.flip_vertical()
-                texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
-                art_callback(index, texture)
-            index += 1
-        if later:
-            Clock.schedule_once(partial(self.add_many_thumbnails, art_callback,
-                                        later, resolution),0.1)
-             
+    def default_art(self):
+        global _default_art
+        if _default_art is None:
+            _default_art = CoreImage(NO_ALBUM_ART).texture
+        return _default_art
+
+    def has_thumbnail(self, track_id, resolution):
+        return (track_id, resolution) in thumbnail_cache
+
+    def prefetch_thumbnails(self, owner, track_ids, resolution):
+        # Replaces the owner's queued prefetches, and is queued behind
+        # every other request. A track being decoded for an earlier
+        # prefetch is not decoded again.
+        self.thumbnail_loader().drop_pending(owner)
+        self.add_many_thumbnails(lambda track_id, texture: None,
+                                 [(tid, tid) for tid in track_ids],
+                                 resolution, owner)
+
+    @metrics.timed('thumbnail.add_many')
+    def add_many_thumbnails(self, art_callback, track_ids, resolution,
+                            owner = None, replace = False):
+        # art_callback(index, texture) is called for each track, texture is
+        # None if there is no art. With replace=True these requests replace
+        # the owner's queued requests, and are loaded first.
+        # cancel_thumbnails(owner) drops any that are not yet loaded.
+        jobs = []
+        for index, tid in track_ids:
+            texture = thumbnail_cache.get((tid, resolution))
+            if texture is None:
+                jobs.append((index, tid, resolution))
+            else:
+                art_callback(index, texture if texture is not _NO_ART else None)
+        metrics.count('thumbnail.cache_misses', len(jobs))
+        metrics.count('thumbnail.cache_hits', len(track_ids) - len(jobs))
+        if jobs or replace:
+            self.thumbnail_loader().request(owner, jobs, art_callback, replace)
+
+    def cancel_thumbnails(self, owner):
+        if _thumbnail_loader:
+            _thumbnail_loader.cancel(owner)
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+from time import monotonic
+
+##################################################################
+# A least recently used cache of track metadata, keyed by media id.
+#
+# lookup(media_id) returns the metadata, for example (title, artist).
+# generation() returns a value that changes when the media changes,
+# then every entry is dropped. The generation is checked at most every
+# check_interval seconds, so a hit normally costs no Java call.
+##################################################################
+
+class MetadataCache():
+
+    def __init__(self, lookup, generation = None, max_entries = 256,
+                 check_interval = 5.0):
+        self.lookup = lookup
+        self.generation = generation
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.current_generation = None
+        self.next_check = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.entries = OrderedDict()   # media_id -> metadata
+
+    def __call__(self, media_id):
+        self.check_generation()
+        if media_id in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(media_id)
+            return self.entries[media_id]
+        self.misses += 1
+        metadata = self.lookup(media_id)
+        self.entries[media_id] = metadata
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last = False)
+        return metadata
+
+    def check_generation(self):
+        if self.generation is None or monotonic() < self.next_check:
+            return
+        self.next_check = monotonic() + self.check_interval
+        generation = self.generation()
+        if generation != self.current_generation:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.current_generation = generation
+
+    def stats(self):
+        return {'entries': len(self.entries), 'hits': self.hits,
+                'misses': self.misses, 'invalidations': self.invalidations}
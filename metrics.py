@@ -0,0 +1,211 @@
+import json
+from bisect import bisect_left
+from functools import wraps
+from threading import Event, Lock, Thread
+from time import perf_counter
+from kivy.logger import Logger
+
+##################################################################
+# Timing spans and counters, for finding where time goes on a device.
+#
+# Metrics are disabled by default. Then timed() and span() add a flag
+# test to the timed code, and count() adds a flag test.
+#
+#   @timed('name')              times each call of a function
+#   with span('name'): ...      times a block
+#   count('name', n)            adds n to a counter
+#
+# Times are kept per name in a Histogram with fixed buckets, so memory
+# does not grow with the number of calls.
+#
+# bind(server, process) adds the OSC address /metrics:
+#   /metrics            answers /metrics [process, json]
+#   /metrics 1 seconds  enables, and logs the metrics every seconds
+#   /metrics 0          disables
+# Each process, the UI and the service, keeps its own metrics.
+##################################################################
+
+# Upper bounds of the buckets, in milliseconds, the last is unbounded
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000,
+              float('inf'))
+
+_enabled = False
+_lock = Lock()
+_histograms = {}    # name -> Histogram
+_counters = {}      # name -> int
+_dump_stop = None    # Event, set to stop the running dump loop
+
+
+class Histogram():
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.buckets[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, fraction):
+        # The upper bound of the bucket containing the percentile
+        target = self.count * fraction
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.buckets):
+            seen += n
+            if seen >= target and n:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count,
+                'mean_ms': self.total / max(1, self.count),
+                'p50_ms': self.percentile(0.5),
+                'p95_ms': self.percentile(0.95),
+                'max_ms': self.max,
+                'buckets': self.buckets}
+
+
+##################
+# Recording
+##################
+
+def enabled():
+    return _enabled
+
+
+def record(name, seconds):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(seconds * 1e3)
+
+
+def count(name, n = 1):
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def timed(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class _Span():
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, perf_counter() - self.start)
+
+
+class _NoSpan():
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, detail = None):
+    # The span is named 'name.detail', if detail is given
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name + '.' + detail if detail else name)
+
+
+##################
+# Reporting
+##################
+
+def enable(dump_interval = 0):
+    # With a dump_interval, log the metrics every dump_interval seconds.
+    # A dump loop already running is replaced.
+    global _enabled, _dump_stop
+    _enabled = True
+    _stop_dump()
+    if dump_interval:
+        _dump_stop = Event()
+        Thread(target=_dump_loop, args=(_dump_stop, dump_interval),
+               daemon=True).start()
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    _stop_dump()
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def snapshot():
+    with _lock:
+        return {'enabled': _enabled,
+                'spans': {name: h.summary()
+                          for name, h in sorted(_histograms.items())},
+                'counters': dict(sorted(_counters.items()))}
+
+
+def dump():
+    metrics = snapshot()
+    for name, s in metrics['spans'].items():
+        Logger.info('Metrics: {} n={} mean={:.2f} p50<={} p95<={} '
+                    'max={:.2f} ms'.format(name, s['count'], s['mean_ms'],
+                                           s['p50_ms'], s['p95_ms'],
+                                           s['max_ms']))
+    for name, value in metrics['counters'].items():
+        Logger.info('Metrics: {} {}'.format(name, value))
+
+
+def _dump_loop(stop, interval):
+    while not stop.wait(interval):
+        dump()
+
+
+def _stop_dump():
+    global _dump_stop
+    if _dump_stop:
+        _dump_stop.set()
+        _dump_stop = None
+
+
+def bind(server, process):
+    # Answered on the OSC server thread, so a busy process still answers
+    def metrics(*args):
+        if args:
+            if args[0]:
+                enable(args[1] if len(args) > 1 else 0)
+            else:
+                disable()
+        server.answer(b'/metrics', [process.encode('utf8'),
+                                    json.dumps(snapshot()).encode('utf8')])
+    server.bind(b'/metrics', metrics)
@@ -1,5 +1,6 @@
+from itertools import chain
 from kivy.lang import Builder
-from kivy.metrics import sp
+from kivy.metrics import sp, dp
 from kivy.utils import rgba
 from kivy.core.window import Window
 from kivy.uix.boxlayout import BoxLayout
@@ -8,7 +9,7 @@ from kivy.uix.modalview import ModalView
 from kivy.properties import NumericProperty, StringProperty, ObjectProperty
 
 from string_lines import StringLines
-from mediastore_utils import MediastoreUtils, MS_FAIL
+from mediastore_utils import MediastoreUtils
 
 ##################################################################
 # MusicPicker is the root_class, it displays a list of Genres.
@@ -17,8 +18,13 @@ from mediastore_utils import MediastoreUtils, MS_FAIL
 # On album selection AlbumPicker opens TrackPicker passing album_id,
 # TrackPicker displays a list of Tracks.
 # On track selection TrackPicker updates the temp track list in MusicPicker.
-# On MusicPicker close the track list is converted to a Uri list
-#   and returned in a callback.
+# A genre or an album may also be added to the temp track list as a whole.
+# MusicPicker also opens SearchPicker, which lists the tracks matching
+#   a search, updated as the search is typed.
+# The lists are read a page at a time, the first page is shown and
+#   later pages are appended as they are read.
+# On MusicPicker close the track list, of MediaStore ids, is returned
+#   in a callback.
 ##################################################################
 
 #######################
@@ -35,10 +41,15 @@ Builder.load_string('''
         orientation: 'vertical'
         GenresRV:
             picker_root: root.picker_root
-        MenuRelativeImageButton:
+        BoxLayout:
             size_hint_y: 0.1
-            pressed: root.quit_picker
-            source: 'icons/arrow_left_white.png'
+            orientation: 'horizontal'
+            MenuRelativeImageButton:
+                pressed: root.quit_picker
+                source: 'icons/arrow_left_white.png'
+            MenuTextButton:
+                text: 'Search'
+                on_press: root.show_search()
 
 <GenresRV>:
     viewclass: 'GenreSelection'
@@ -54,6 +65,8 @@ Builder.load_string('''
     MenuTextButton:
         text: root.genre_name
         on_press: root.show_albums()
+    MenuAddAllButton:
+        on_press: root.add_all()
     MenuBackGesturePadding
 
 <MenuBackground@Widget>:
@@ -68,6 +81,12 @@ Builder.load_string('''
 
 <MenuImageButton@ButtonBehavior+Image>:
 
+<MenuAddAllButton@MenuTextButton>:
+    text: '+'
+    font_size: '24sp'
+    size_hint_x: None
+    width: self.height
+
 <MenuRelativeImageButton@RelativeLayout>:
     pressed: None
     source: ''
@@ -98,15 +117,24 @@ class MusicPicker(ModalView):
         super().__init__(**args)
         self.picker_root = self
         self.callback = callback
-        self.temp_track_list = []
-        if MS_FAIL:
+        # An ordered set of track ids, dict gives O(1) membership and removal
+        self.temp_track_list = {}
+        ms = MediastoreUtils()
+        if ms.available():
+            ms.refresh_catalog()
+        else:
             self.quit_picker()
 
     def on_pre_dismiss(self,*args):
-        uris = []
-        for track_id in self.temp_track_list:
-            uris.append(MediastoreUtils().id_to_uri(track_id))
-        self.callback(uris)
+        self.callback(list(self.temp_track_list))
+
+    def add_tracks(self, track_ids):
+        # In order, a track already in the list keeps its place
+        for track_id in track_ids:
+            self.temp_track_list[track_id] = True
+
+    def show_search(self):
+        SearchPicker(self.picker_root).open()
 
     def quit_picker(self):
         self.dismiss()
@@ -116,10 +144,14 @@ class GenresRV(RecycleView):
     picker_root = ObjectProperty()
 
     def on_picker_root(self, obj, items):
-        genres = MediastoreUtils().list_genres()
+        self.data = []
+        ms = MediastoreUtils()
+        ms.load_pages(ms.genre_pages(), self.add_page, 'Genres')
+
+    def add_page(self, genres):
         for g in genres:
             g['picker_root'] = self.picker_root
-        self.data = genres
+        self.data.extend(genres)
         
 class GenreSelection(BoxLayout):
     genre_id = NumericProperty()
@@ -129,6 +161,10 @@ class GenreSelection(BoxLayout):
     def show_albums(self):
         AlbumPicker(self.genre_id, self.picker_root).open()
 
+    def add_all(self):
+        self.picker_root.add_tracks(
+            MediastoreUtils().genre_track_ids(self.genre_id))
+
 
 #######################
 # Album Picker
@@ -141,6 +177,7 @@ Builder.load_string('''
     BoxLayout:
         orientation: 'vertical'
         Albums:
+            id: albums
             picker_root: root.picker_root
             genre_id: root.genre_id
         MenuRelativeImageButton:
@@ -167,6 +204,8 @@ Builder.load_string('''
     MenuTextButton:
         text: root.album_name
         on_press: root.show_tracks()
+    MenuAddAllButton:
+        on_press: root.add_all()
     MenuBackGesturePadding
 
 ''')
@@ -180,12 +219,31 @@ class AlbumPicker(ModalView):
         self.genre_id = genre_id
         self.picker_root = picker_root
 
+    def on_dismiss(self):
+        # Stop reading, and decoding album art for, this list
+        self.ids.albums.stop_loading()
+        MediastoreUtils().cancel_thumbnails(self.ids.albums)
+
     def quit_picker(self):
         self.dismiss()
         
 class Albums(RecycleView):
     genre_id = NumericProperty()
     picker_root = ObjectProperty()
+    # Album art is loaded for visible rows, then this many rows ahead
+    # in the scroll direction. Other rows are loaded when scrolled to.
+    lookahead = NumericProperty(14)
+    row_height = NumericProperty(dp(56))
+
+    def __init__(self, **args):
+        super().__init__(**args)
+        self.art_ids = []       # index -> track_id
+        self.loaded = set()     # indexes with art, or known to have none
+        self.art_window = None
+        self.last_scroll_y = 1
+        self.loading = None     # set to stop reading pages
+        self.fbind('scroll_y', self.load_visible_art)
+        self.fbind('height', self.load_visible_art)
 
     def on_picker_root(self, obj, items):
         if self.genre_id:
@@ -196,21 +254,70 @@ class Albums(RecycleView):
             self.read_mediastore()
 
     def art_callback(self, index, texture):
-        self.data[index]['album_art'] = texture    
+        self.loaded.add(index)
+        if texture is None:
+            return
+        self.data[index]['album_art'] = texture
+        # A visible view is not updated from data, so set it directly.
+        view = self.view_adapter.get_visible_view(index)
+        if view:
+            view.album_art = texture
         
     def read_mediastore(self):
+        self.stop_loading()
+        self.data = []
+        self.art_ids = []
+        self.loaded = set()
+        self.art_window = None
+        ms = MediastoreUtils()
+        self.loading = ms.load_pages(ms.album_pages(self.genre_id),
+                                     self.add_page, 'Albums')
+
+    def add_page(self, page):
         # Don't know how long the label will be, so guess 85% of Window
-        # based on image on left and padding on right.
-        sl = StringLines()
-        max_cols = sl.estimate_columns(sp(16),round(Window.width * 0.85))
-        
-        albums, arts = MediastoreUtils().list_albums_in_genre(self.genre_id)
+        # based on image on left and padding on right, less the button.
+        albums, arts = page
         for a in albums:
             a['picker_root'] = self.picker_root
-            a['album_name'] = sl.multiline_string(a['album_name'], max_cols, 2)
-        self.data = albums
+        StringLines().fit_data(albums, 'album_name', sp(16),
+                               round(Window.width * 0.85 - dp(56)), 2)
+        self.data.extend(albums)
+        self.art_ids.extend(track_id for index, track_id in arts)
+        self.art_window = None
+        self.load_visible_art()
+
+    def stop_loading(self):
+        if self.loading:
+            self.loading.set()
+
+    def visible_range(self):
+        rows = len(self.data)
+        content_height = rows * self.row_height
+        if content_height <= self.height:
+            return 0, rows
+        top = (1 - self.scroll_y) * (content_height - self.height)
+        first = max(0, int(top // self.row_height))
+        last = min(rows, int((top + self.height) // self.row_height) + 1)
+        return first, last
+
+    def load_visible_art(self, *args):
+        if not self.art_ids:
+            return
+        first, last = self.visible_range()
+        down = self.scroll_y <= self.last_scroll_y
+        self.last_scroll_y = self.scroll_y
+        if (first, last, down) == self.art_window:
+            return
+        self.art_window = (first, last, down)
+        if down:
+            ahead = range(last, min(len(self.art_ids), last + self.lookahead))
+        else:
+            ahead = range(first - 1, max(-1, first - 1 - self.lookahead), -1)
+        wanted = [(i, self.art_ids[i]) for i in chain(range(first, last), ahead)
+                  if i not in self.loaded]
         # resolution of 160 is picked for speed
-        MediastoreUtils().add_many_thumbnails(self.art_callback, arts, 160, 0)
+        MediastoreUtils().add_many_thumbnails(self.art_callback, wanted, 160,
+                                              self, replace = True)
 
             
 class AlbumSelection(BoxLayout):
@@ -222,6 +329,10 @@ class AlbumSelection(BoxLayout):
     def show_tracks(self):
         TrackPicker(self.album_id, self.picker_root).open()
 
+    def add_all(self):
+        self.picker_root.add_tracks(
+            MediastoreUtils().album_track_ids(self.album_id))
+
 #######################
 # Track Picker
 #######################
@@ -240,6 +351,7 @@ Builder.load_string('''
         Label:
             size_hint_y: 0.05
         TracksRV:
+            id: tracks
             picker_root: root.picker_root
             album_id: root.album_id
         MenuRelativeImageButton:
@@ -294,6 +406,9 @@ class TrackPicker(ModalView):
         self.picker_root = picker_root        
         self.selected = []
 
+    def on_dismiss(self):
+        self.ids.tracks.stop_loading()
+
     def quit_picker(self):
         self.dismiss()
 
@@ -309,16 +424,20 @@ class TrackHeader(BoxLayout):
     def on_album_id(self, album_id, items):
         album, artist = MediastoreUtils().list_album_info(self.art_callback,
                                                           self.album_id)
-        sl = StringLines()    # another estimate..
-        max_cols = sl.estimate_columns(sp(16),round(Window.width * 0.8))
-        self.album_title = sl.multiline_string(album, max_cols, 2)
-        self.album_artist = sl.multiline_string(artist, max_cols, 2)
+        sl = StringLines()
+        width = round(Window.width * 0.8)
+        self.album_title = sl.fit(album, sp(16), width, 2, bold = True)
+        self.album_artist = sl.fit(artist, sp(16), width, 2, bold = True)
 
         
 class TracksRV(RecycleView):
     album_id = NumericProperty()
     picker_root = ObjectProperty()
 
+    def __init__(self, **args):
+        super().__init__(**args)
+        self.loading = None     # set to stop reading pages
+
     def on_picker_root(self, obj, items):
         if self.album_id:
             self.read_mediastore()
@@ -328,13 +447,22 @@ class TracksRV(RecycleView):
             self.read_mediastore()
         
     def read_mediastore(self):
-        tracks = MediastoreUtils().list_tracks_in_album(self.album_id)
-        sl = StringLines()    # another estimate..
-        max_cols = sl.estimate_columns(sp(16),round(Window.width * 0.9))
+        self.stop_loading()
+        self.data = []
+        ms = MediastoreUtils()
+        self.loading = ms.load_pages(ms.track_pages(self.album_id),
+                                     self.add_page, 'Tracks')
+
+    def add_page(self, tracks):
         for t in tracks:
             t['picker_root'] = self.picker_root
-            t['track_name'] = sl.multiline_string(t['track_name'], max_cols, 2)
-        self.data = tracks
+        StringLines().fit_data(tracks, 'track_name', sp(16),
+                               round(Window.width * 0.9), 2)
+        self.data.extend(tracks)
+
+    def stop_loading(self):
+        if self.loading:
+            self.loading.set()
         
 
 class TrackSelection(BoxLayout):
@@ -351,14 +479,77 @@ class TrackSelection(BoxLayout):
             self.update_selected()
 
     def update_selected(self):
+        # A recycled view may have been selected for another track
         if self.track_id in self.picker_root.temp_track_list:
             self.ids.mtb.color = rgba('#800000')
+        else:
+            self.ids.mtb.color = rgba('#FFFFFF')
             
     def pick_item(self):
         if self.track_id in self.picker_root.temp_track_list:
-            self.picker_root.temp_track_list.remove(self.track_id)
+            del self.picker_root.temp_track_list[self.track_id]
             self.ids.mtb.color = rgba('#FFFFFF')
         else:
-            self.picker_root.temp_track_list.append(self.track_id)
+            self.picker_root.temp_track_list[self.track_id] = True
             self.ids.mtb.color = rgba('#800000')
 
+
+
+#######################
+# Search Picker
+#######################
+
+Builder.load_string('''
+<SearchPicker>:
+    border: (0,0,0,0)
+    MenuBackground
+    BoxLayout:
+        orientation: 'vertical'
+        TextInput:
+            size_hint_y: None
+            height: dp(48)
+            multiline: False
+            font_size: '16sp'
+            hint_text: 'Title, album, or artist'
+            on_text: results.search(self.text)
+        SearchRV:
+            id: results
+            picker_root: root.picker_root
+        MenuRelativeImageButton:
+            size_hint_y: 0.1
+            pressed: root.quit_picker
+            source: 'icons/arrow_left_white.png'
+
+<SearchRV>:
+    viewclass: 'TrackSelection'
+    RecycleBoxLayout:
+        default_size: None, dp(56)
+        default_size_hint: 1, None
+        size_hint_y: None
+        height: self.minimum_height
+        orientation: 'vertical'
+
+''')
+
+class SearchPicker(ModalView):
+    picker_root = ObjectProperty()
+
+    def __init__(self, picker_root, **args):
+        super().__init__(**args)
+        self.picker_root = picker_root
+
+    def quit_picker(self):
+        self.dismiss()
+
+
+class SearchRV(RecycleView):
+    picker_root = ObjectProperty()
+
+    def search(self, text):
+        # On every keystroke, the search index answers in a few ms
+        tracks = MediastoreUtils().search_tracks(text)
+        for t in tracks:
+            t['picker_root'] = self.picker_root
+        StringLines().fit_data(tracks, 'track_name', sp(16),
+                               round(Window.width * 0.9), 2)
+        self.data = tracks
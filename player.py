@@ -0,0 +1,294 @@
+from queue import Queue, Empty
+from time import monotonic
+from kivy.logger import Logger
+
+import metrics
+
+from playlist import Playlist, id_from_uri
+from playlist_transfer import PlaylistReceiver
+from player_state import PlayerState
+from prefetcher import Prefetcher
+
+##################################################################
+# The music player, it runs in the service.
+#
+# Player is an actor: every input, OSC commands from the UI and
+# MediaPlayer events, is posted as a message to one queue. Messages are
+# processed in order on the thread that calls run(), so the player state
+# is only changed on that thread. When there are no messages that
+# thread blocks.
+#
+# A track start, and a state report, is deferred until the queue is
+# empty, or until a message other than a skip arrives. So a burst of
+# skips starts, and looks up the metadata of, only the last track.
+#
+# The state shown by the UI is a versioned PlayerState, including the
+# track metadata. It is pushed to the UI when it changes, and the UI
+# asks for the changes since the version it last saw.
+#
+# When there are no messages, the metadata of the tracks either side of
+# the playing track is prefetched. The UI is sent their media ids as
+#   /upcoming [media_id, ...]
+# so it can prefetch their album art.
+#
+# The UI checks the service is running with /ping, answered on the OSC
+# server thread, so a busy Player still answers at once
+#   /pong [queued messages, ms the current action has run]
+#
+# The media player, OSC client, and metadata lookup are passed in, so
+# a Player can be driven off device (see benchmarks/player_harness.py).
+##################################################################
+
+class Player:
+
+    def __init__(self, player, client, context, journal = None,
+                 metadata = None, prefetch_window = 2):
+        self.player = player        # AndroidMediaPlayer
+        self.client = client        # OSCClient to the UI
+        self.context = context      # Android Context
+        self.journal = journal      # PlaylistJournal, or None
+        # metadata(media_id) returns (title, artist)
+        self.metadata = metadata or (lambda media_id: ('', ''))
+        self.prefetcher = Prefetcher(self.metadata, prefetch_window)
+        self.state = PlayerState()
+        self.state_sent = 0         # the state version the UI was sent
+        self.messages = Queue()
+        self.playlist = Playlist()
+        self.now_playing = 0
+        self.loop_running = False
+        self.paused = False
+        self.start_pending = False
+        self.report_pending = False
+        self.action_started = 0     # monotonic(), 0 when waiting
+        # Messages that do not need a pending start to happen first
+        self.deferrable = {self.skip_next, self.skip_previous, self.play_next,
+                           self.terminate}
+        self.receiver = PlaylistReceiver(self.client.send_message,
+                                         self.add_playlist_chunk)
+
+    #############
+    # Messages
+    #############
+
+    def post(self, action, *args):
+        # May be called from any thread
+        self.messages.put((action, args))
+
+    def handler(self, action):
+        # Returns a function that posts action
+        return lambda *args: self.post(action, *args)
+
+    def bind(self, server):
+        # UI events
+        server.bind(b'/add_playlist', self.handler(self.add_playlist))
+        server.bind(b'/playlist_chunk', self.handler(self.receiver.chunk))
+        server.bind(b'/terminate', self.handler(self.terminate))
+        server.bind(b'/play', self.handler(self.play))
+        server.bind(b'/pause', self.handler(self.pause))
+        server.bind(b'/skip_next', self.handler(self.skip_next))
+        server.bind(b'/skip_previous', self.handler(self.skip_previous))
+        server.bind(b'/service_state', self.handler(self.service_state))
+        server.bind(b'/ping', self.ping)
+
+    def ping(self):
+        # Called on the OSC server thread
+        started = self.action_started
+        action_ms = round((monotonic() - started) * 1000) if started else 0
+        self.client.send_message(b'/pong', [self.messages.qsize(), action_ms])
+
+    #############
+    # Event Loop
+    #############    
+
+    def run(self):
+        # Android MediaPlayer Event
+        self.player.init_player(self.handler(self.play_next), self.post)
+        if self.journal:
+            # Continue from before a restart
+            self.playlist, self.now_playing = self.journal.load()
+            if self.now_playing >= len(self.playlist):
+                self.now_playing = 0
+        self.loop_running = True
+        while self.loop_running:
+            if self.messages.empty():
+                self.run_pending()
+            try:
+                action, args =\
+                    self.messages.get(timeout = self.prefetcher.delay())
+            except Empty:
+                self.run_action(self.prefetcher.step)
+                continue
+            if action not in self.deferrable:
+                self.run_pending()
+            self.run_action(action, *args)
+
+    def run_pending(self):
+        if self.start_pending:
+            self.run_action(self.start_now)
+        if self.report_pending:
+            self.run_action(self.report_now)
+
+    def run_action(self, action, *args):
+        self.action_started = monotonic()
+        try:
+            with metrics.span('player', action.__name__):
+                action(*args)
+        except Exception as e:
+            Logger.error('Player ' + action.__name__ + ' failed.\n' + str(e))
+        finally:
+            self.action_started = 0
+
+    ##################
+    # Event Actions
+    ##################
+
+    def add_playlist(self, *uri_list):
+        self.extend(self.media_ids(uri_list))
+        self.report_state()
+        self.prepare_next()
+
+    def add_playlist_chunk(self, items, last):
+        # Report the state when the transfer is complete, or if this
+        # chunk starts the playlist.
+        report = last or not self.playlist
+        self.extend(self.media_ids(items))
+        if report:
+            self.report_state()
+        self.prepare_next()
+
+    def media_ids(self, items):
+        # items are media ids, or MediaStore audio uris
+        ids = []
+        for uri in items:
+            media_id = uri if isinstance(uri, int) else id_from_uri(uri)
+            if media_id is None:
+                Logger.warning('Player ignored ' + repr(uri) +
+                               ', it is not a MediaStore audio uri.')
+            else:
+                ids.append(media_id)
+        return ids
+
+    def terminate(self):
+        self.playlist.clear()
+        self.record('clear')
+        self.start_pending = False
+        self.loop_running = False
+        self.report_now()
+        self.player.stop()
+        self.player.release()
+        if self.journal:
+            self.journal.close()
+        Logger.info('Player metadata prefetch ' +
+                    str(self.prefetcher.stats()))
+
+    def play(self, *action_list):
+        if self.playlist:
+            if self.paused:
+                self.paused = False
+                self.player.resume()
+            else:
+                self.start()
+
+    def pause(self, *action_list):
+        if self.playlist and not self.paused:
+            self.player.pause()
+            self.paused = True
+
+    def skip_next(self):
+        self.player.stop()
+        self.play_next()
+
+    def skip_previous(self):
+        if self.now_playing < 1:
+            self.now_playing = len(self.playlist)
+        self.now_playing = self.now_playing -1
+        self.record('position', self.now_playing)
+        self.player.stop()
+        self.report_state()
+        if not self.paused:
+            self.start()
+
+    def play_next(self):
+        self.now_playing = self.now_playing +1
+        if self.now_playing >= len(self.playlist):
+            self.now_playing = 0
+        self.record('position', self.now_playing)
+        self.report_state()
+        if not self.paused:
+            self.start()
+
+    def extend(self, ids):
+        self.playlist.extend(ids)
+        self.record('extend', ids)
+
+    def record(self, change, *args):
+        # Persist a change to the playlist or position
+        if self.journal:
+            getattr(self.journal, change)(*args)
+            if self.journal.needs_compaction(self.playlist):
+                self.journal.compact(self.playlist, self.now_playing)
+
+    def start(self):
+        self.start_pending = True
+
+    def start_now(self):
+        # If this track is prepared as the next track it is started
+        # without a prepare, or is already playing after a completion.
+        self.start_pending = False
+        if self.playlist:
+            self.player.start(self.context, self.playlist.uri(self.now_playing))
+            self.prepare_next()
+
+    def prepare_next(self):
+        # For gapless playback, prepare the track after now_playing
+        if len(self.playlist) > 1:
+            following = (self.now_playing + 1) % len(self.playlist)
+            self.player.prepare_next(self.context, self.playlist.uri(following))
+
+    def service_state(self, epoch = 0, version = 0):
+        # From the UI, with the state version it last saw. Without a
+        # version the UI is sent the whole state.
+        self.state_sent = self.state.since(epoch, version)
+        self.report_pending = False
+        self.update_state()
+        self.send_state()
+        self.send_upcoming(self.prefetcher.current or [])
+
+    def report_state(self):
+        self.report_pending = True
+
+    def report_now(self):
+        # Push any changes to the UI
+        self.report_pending = False
+        if self.update_state():
+            self.send_state()
+            upcoming = self.prefetcher.follow(self.playlist, self.now_playing)
+            if upcoming is not None:
+                self.send_upcoming(upcoming)
+
+    def update_state(self):
+        if self.playlist:
+            media_id = self.playlist[self.now_playing]
+        else:
+            media_id = -1
+        if media_id != self.state.get('media_id'):
+            # Only a new track needs a MediaStore query
+            if media_id >= 0:
+                self.prefetcher.played(media_id)
+            title, artist = self.metadata(media_id) if media_id >= 0\
+                else ('', '')
+        else:
+            title = self.state.get('title')
+            artist = self.state.get('artist')
+        return self.state.update(media_id = media_id, title = title,
+                                 artist = artist,
+                                 position = self.now_playing,
+                                 length = len(self.playlist))
+
+    def send_state(self):
+        self.client.send_message(b'/state',
+                                 self.state.message(self.state_sent))
+        self.state_sent = self.state.version
+
+    def send_upcoming(self, media_ids):
+        self.client.send_message(b'/upcoming', media_ids)
@@ -0,0 +1,55 @@
+from random import getrandbits
+
+##################################################################
+# The Player state that is shown by the UI, with a version number.
+#
+# Each update() that changes a field increments the version, and
+# records that version against the changed fields. So the changes since
+# any earlier version can be sent, rather than the whole state.
+#
+# The epoch identifies this instance. A version from another epoch,
+# for example from before the service restarted, is not comparable and
+# gets the whole state.
+#
+# The OSC message is:
+#   /state  [epoch, since, version, name, value, name, value, ...]
+# with the fields that changed after version since.
+##################################################################
+
+class PlayerState():
+
+    def __init__(self):
+        self.epoch = getrandbits(30)
+        self.version = 0
+        self.values = {}      # name -> value
+        self.versions = {}    # name -> version when the value last changed
+
+    def get(self, name, default = None):
+        return self.values.get(name, default)
+
+    def update(self, **fields):
+        # Returns True if any field changed
+        changed = [name for name, value in fields.items()
+                   if name not in self.values or self.values[name] != value]
+        if changed:
+            self.version += 1
+            for name in changed:
+                self.values[name] = fields[name]
+                self.versions[name] = self.version
+        return bool(changed)
+
+    def since(self, epoch, version):
+        # The version the changes are since, for another epoch that is 0
+        if epoch != self.epoch or version > self.version:
+            return 0
+        return version
+
+    def message(self, since):
+        values = [self.epoch, since, self.version]
+        for name, version in self.versions.items():
+            if version > since:
+                value = self.values[name]
+                if isinstance(value, str):
+                    value = value.encode('utf8')
+                values += [name.encode('utf8'), value]
+        return values
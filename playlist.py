@@ -0,0 +1,119 @@
+from array import array
+
+##################################################################
+# A playlist of MediaStore audio ids, held in a packed array.
+#
+# The content uri of an entry is built when it is needed. A count of
+# each id gives O(1) membership and duplicate tests. Insert, remove and
+# move at any position are a memmove of the array.
+#
+# MediaStore ids are row ids, so usually small. The counts of ids below
+# DENSE_IDS are a bytearray indexed by id, other counts are in a dict.
+##################################################################
+
+MEDIA_URI = b'content://media/external/audio/media/'
+DENSE_IDS = 1 << 22
+
+
+def id_from_uri(uri):
+    # Returns the media id of a MediaStore audio uri, or None
+    try:
+        return int(bytes(uri).rsplit(b'/', 1)[-1])
+    except ValueError:
+        return None
+
+
+class Playlist():
+
+    def __init__(self, ids = ()):
+        self.ids = array('q')
+        self.dense = bytearray()    # id -> count, 255 means see sparse
+        self.sparse = {}            # id -> count, for other ids and counts
+        self.extend(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, position):
+        return self.ids[position]
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, media_id):
+        return self.count(media_id) > 0
+
+    def uri(self, position):
+        return MEDIA_URI + str(self.ids[position]).encode('utf8')
+
+    def count(self, media_id):
+        if 0 <= media_id < len(self.dense):
+            count = self.dense[media_id]
+            return count if count < 255 else self.sparse[media_id]
+        return self.sparse.get(media_id, 0)
+
+    def index(self, media_id):
+        return self.ids.index(media_id)
+
+    ##################
+    # Changes
+    ##################
+
+    def append(self, media_id):
+        self.ids.append(media_id)
+        self._count(media_id, 1)
+
+    def extend(self, media_ids):
+        start = len(self.ids)
+        self.ids.extend(media_ids)
+        added = self.ids[start:]
+        if added:
+            top = max(added)
+            if len(self.dense) <= top < DENSE_IDS:
+                self.dense.extend(bytes(top + 1 - len(self.dense)))
+        for media_id in added:
+            self._count(media_id, 1)
+
+    def insert(self, position, media_id):
+        self.ids.insert(position, media_id)
+        self._count(media_id, 1)
+
+    def pop(self, position = -1):
+        media_id = self.ids.pop(position)
+        self._count(media_id, -1)
+        return media_id
+
+    def remove(self, media_id):
+        # Removes the first entry of media_id
+        self.ids.remove(media_id)
+        self._count(media_id, -1)
+
+    def move(self, source, destination):
+        media_id = self.ids.pop(source)
+        self.ids.insert(destination, media_id)
+
+    def clear(self):
+        self.ids = array('q')
+        self.dense = bytearray()
+        self.sparse = {}
+
+    def _count(self, media_id, change):
+        if 0 <= media_id < DENSE_IDS:
+            if media_id >= len(self.dense):
+                self.dense.extend(bytes(media_id + 1 - len(self.dense)))
+            count = self.dense[media_id]
+            if count == 255:
+                count = self.sparse[media_id]
+            count += change
+            if count < 255:
+                self.dense[media_id] = count
+                self.sparse.pop(media_id, None)
+            else:
+                self.dense[media_id] = 255
+                self.sparse[media_id] = count
+        else:
+            count = self.sparse.get(media_id, 0) + change
+            if count:
+                self.sparse[media_id] = count
+            else:
+                del self.sparse[media_id]
@@ -0,0 +1,231 @@
+import os
+import struct
+from array import array
+from threading import Thread, Condition
+from time import monotonic
+from kivy.logger import Logger
+
+from playlist import Playlist
+
+##################################################################
+# Persists the Player's playlist and position, so that a restarted
+# service continues where it was.
+#
+# Changes are appended to a journal. The journal is written and
+# fsync'd by a writer thread, at most every sync_interval seconds, so
+# the Player never waits on the disk. When the journal is larger than
+# the playlist, compact() replaces it with a snapshot.
+#
+# A snapshot and a journal each start with a generation number. A
+# journal replays onto the snapshot with the same generation, any other
+# journal is older than the snapshot and is ignored.
+#
+# Records are (op, n) followed by n int64 values. A partial record at
+# the end of the journal is ignored.
+##################################################################
+
+EXTEND = 1       # ids...
+INSERT = 2       # position, id
+POP = 3          # position
+MOVE = 4         # source, destination
+CLEAR = 5
+POSITION = 6     # now_playing
+
+HEADER = struct.Struct('<BI')
+GENERATION = struct.Struct('<q')
+SNAPSHOT = 'snapshot.bin'
+JOURNAL = 'journal.bin'
+MIN_COMPACT_BYTES = 64 * 1024
+
+
+class PlaylistJournal():
+
+    def __init__(self, directory, sync_interval = 1.0):
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.condition = Condition()
+        self.buffer = bytearray()     # records not yet written
+        self.snapshot = None          # (generation, ids, position) to write
+        self.generation = 0
+        self.journal_bytes = 0
+        self.running = True
+        # Write amplification is bytes_written / bytes_recorded
+        self.bytes_recorded = 0
+        self.bytes_written = 0
+        os.makedirs(directory, exist_ok = True)
+        self.writer = Thread(target=self._writer, daemon=True)
+
+    ##################
+    # Recovery
+    ##################
+
+    def load(self):
+        # Returns (Playlist, now_playing), then starts the writer.
+        playlist = Playlist()
+        position = 0
+        try:
+            with open(self._path(SNAPSHOT), 'rb') as f:
+                data = f.read()
+            generation, position, count = struct.unpack_from('<qqq', data)
+            ids = array('q')
+            ids.frombytes(data[24:24 + count * 8])
+            playlist.extend(ids)
+            self.generation = generation
+        except (OSError, struct.error):
+            pass
+        try:
+            with open(self._path(JOURNAL), 'rb') as f:
+                data = f.read()
+            if len(data) >= GENERATION.size and\
+               GENERATION.unpack_from(data)[0] == self.generation:
+                position, end = self._replay(data, playlist, position)
+                if end < len(data):
+                    # Drop a partial record, so appends follow a whole one
+                    with open(self._path(JOURNAL), 'r+b') as f:
+                        f.truncate(end)
+                self.journal_bytes = end
+            else:
+                self._new_journal()
+        except OSError:
+            self._new_journal()
+        self.writer.start()
+        return playlist, position
+
+    def _replay(self, data, playlist, position):
+        offset = GENERATION.size
+        while offset + HEADER.size <= len(data):
+            op, n = HEADER.unpack_from(data, offset)
+            end = offset + HEADER.size + n * 8
+            if end > len(data):
+                break
+            values = array('q')
+            values.frombytes(data[offset + HEADER.size:end])
+            offset = end
+            if op == EXTEND:
+                playlist.extend(values)
+            elif op == INSERT:
+                playlist.insert(values[0], values[1])
+            elif op == POP:
+                playlist.pop(values[0])
+            elif op == MOVE:
+                playlist.move(values[0], values[1])
+            elif op == CLEAR:
+                playlist.clear()
+                position = 0
+            elif op == POSITION:
+                position = values[0]
+        return position, offset
+
+    ##################
+    # Changes
+    ##################
+
+    def extend(self, ids):
+        self._record(EXTEND, ids)
+
+    def insert(self, position, media_id):
+        self._record(INSERT, (position, media_id))
+
+    def pop(self, position):
+        self._record(POP, (position,))
+
+    def move(self, source, destination):
+        self._record(MOVE, (source, destination))
+
+    def clear(self):
+        self._record(CLEAR, ())
+
+    def position(self, now_playing):
+        self._record(POSITION, (now_playing,))
+
+    def needs_compaction(self, playlist):
+        return self.journal_bytes > max(MIN_COMPACT_BYTES, len(playlist) * 8)
+
+    def compact(self, playlist, position):
+        # The snapshot contains every change so far, so records not yet
+        # written are dropped.
+        with self.condition:
+            self.generation += 1
+            self.snapshot = (self.generation, array('q', playlist.ids),
+                             position)
+            self.buffer = bytearray()
+            self.journal_bytes = GENERATION.size
+            self.condition.notify()
+
+    def close(self):
+        # Writes everything, and stops the writer
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.writer.is_alive():
+            self.writer.join()
+
+    def stats(self):
+        return {'bytes_recorded': self.bytes_recorded,
+                'bytes_written': self.bytes_written,
+                'journal_bytes': self.journal_bytes,
+                'write_amplification':
+                self.bytes_written / max(1, self.bytes_recorded)}
+
+    def _record(self, op, values):
+        record = HEADER.pack(op, len(values)) + array('q', values).tobytes()
+        with self.condition:
+            self.buffer += record
+            self.journal_bytes += len(record)
+            self.bytes_recorded += len(record)
+            self.condition.notify()
+
+    ##################
+    # Writer thread
+    ##################
+
+    def _writer(self):
+        running = True
+        while running:
+            with self.condition:
+                while self.running and not self.buffer and not self.snapshot:
+                    self.condition.wait()
+                running = self.running
+            # Let changes accumulate, one write and fsync per interval
+            deadline = monotonic() + self.sync_interval
+            with self.condition:
+                while self.running and monotonic() < deadline:
+                    self.condition.wait(deadline - monotonic())
+            with self.condition:
+                snapshot = self.snapshot
+                buffer = self.buffer
+                self.snapshot = None
+                self.buffer = bytearray()
+            try:
+                if snapshot:
+                    self._write_snapshot(*snapshot)
+                if buffer:
+                    with open(self._path(JOURNAL), 'ab') as f:
+                        f.write(buffer)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self.bytes_written += len(buffer)
+            except OSError as e:
+                Logger.warning('Playlist journal write failed.\n' + str(e))
+
+    def _write_snapshot(self, generation, ids, position):
+        data = struct.pack('<qqq', generation, position, len(ids)) +\
+            ids.tobytes()
+        self._write_file(SNAPSHOT, data)
+        self._write_file(JOURNAL, GENERATION.pack(generation))
+        self.bytes_written += len(data) + GENERATION.size
+
+    def _new_journal(self):
+        self._write_file(JOURNAL, GENERATION.pack(self.generation))
+        self.journal_bytes = GENERATION.size
+
+    def _write_file(self, name, data):
+        path = self._path(name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
@@ -0,0 +1,158 @@
+from random import getrandbits
+from threading import Thread, Condition
+from time import monotonic
+from kivy.logger import Logger
+
+import metrics
+
+##################################################################
+# Playlist transfer over OSC, in acknowledged chunks.
+#
+# A playlist is too large for one UDP datagram, so the sender splits it
+# into chunks of at most chunk_bytes:
+#   /playlist_chunk  [transfer_id, seq, total, item, item, ...]
+# the receiver acknowledges every chunk, including duplicates:
+#   /playlist_ack    [transfer_id, seq]
+# The sender keeps at most window chunks unacknowledged, and resends a
+# chunk that is not acknowledged within timeout seconds.
+# The receiver delivers chunks in seq order, and ignores duplicates.
+# A transfer the sender gave up on is dropped by the receiver when no
+# chunk of it has arrived for expire seconds.
+#
+# send(address, values) sends an OSC message, it is an OSCClient's
+# send_message().
+##################################################################
+
+CHUNK_BYTES = 8192
+
+
+class PlaylistSender():
+
+    def __init__(self, send, chunk_bytes = CHUNK_BYTES, window = 8,
+                 timeout = 0.25, retries = 20):
+        self.send = send
+        self.chunk_bytes = chunk_bytes
+        self.window = window
+        self.timeout = timeout
+        self.retries = retries
+        self.condition = Condition()
+        self.transfers = {}    # transfer_id -> set of acknowledged seq
+        # Transfer ids must not repeat if the app restarts
+        self.next_id = getrandbits(30)
+
+    def send_playlist(self, items):
+        # items are bytes or ints, the transfer is done on a new thread.
+        chunks = self.chunks(items)
+        if not chunks:
+            return
+        with self.condition:
+            transfer_id = self.next_id
+            self.next_id = (self.next_id + 1) & 0x3fffffff
+            self.transfers[transfer_id] = set()
+        Thread(target=self._transfer, args=(transfer_id, chunks),
+               daemon=True).start()
+        return transfer_id
+
+    def ack(self, transfer_id, seq):
+        with self.condition:
+            acked = self.transfers.get(transfer_id)
+            if acked is not None:
+                acked.add(seq)
+                self.condition.notify_all()
+
+    def chunks(self, items):
+        chunks = []
+        chunk = []
+        size = 0
+        for item in items:
+            # OSC pads each string argument to 4 bytes, and adds a type tag
+            item_size = 5 if isinstance(item, int) else len(item) + 5
+            if chunk and size + item_size > self.chunk_bytes:
+                chunks.append(chunk)
+                chunk = []
+                size = 0
+            chunk.append(item)
+            size += item_size
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _transfer(self, transfer_id, chunks):
+        total = len(chunks)
+        sent = {}     # seq -> (time sent, tries)
+        next_seq = 0
+        with self.condition:
+            acked = self.transfers[transfer_id]
+            while len(acked) < total:
+                now = monotonic()
+                in_flight = [s for s in sent if s not in acked]
+                for seq in in_flight:
+                    time_sent, tries = sent[seq]
+                    if now - time_sent < self.timeout:
+                        continue
+                    if tries >= self.retries:
+                        Logger.warning('Playlist transfer failed, chunk ' +
+                                       str(seq) + ' of ' + str(total) +
+                                       ' was not acknowledged.')
+                        del self.transfers[transfer_id]
+                        return
+                    self._send(transfer_id, seq, total, chunks[seq])
+                    sent[seq] = (now, tries + 1)
+                    metrics.count('playlist.resent_chunks')
+                while next_seq < total and len(in_flight) < self.window:
+                    self._send(transfer_id, next_seq, total, chunks[next_seq])
+                    sent[next_seq] = (now, 1)
+                    in_flight.append(next_seq)
+                    next_seq += 1
+                self.condition.wait(self.timeout)
+            del self.transfers[transfer_id]
+
+    def _send(self, transfer_id, seq, total, items):
+        with metrics.span('osc.send_chunk'):
+            self.send(b'/playlist_chunk', [transfer_id, seq, total] + items)
+
+
+class PlaylistReceiver():
+
+    def __init__(self, send, deliver, completed = 64, expire = 30.0):
+        # deliver(items, last) is called for each chunk, in seq order,
+        # last is True for the final chunk of a transfer.
+        self.send = send
+        self.deliver = deliver
+        self.completed = []           # recent transfer_ids, oldest first
+        self.max_completed = completed
+        self.expire = expire
+        # transfer_id -> [next seq, {seq: items}, time of the last chunk]
+        self.transfers = {}
+
+    def chunk(self, transfer_id, seq, total, *items):
+        self.send(b'/playlist_ack', [transfer_id, seq])
+        if transfer_id in self.completed:
+            return
+        now = monotonic()
+        self._expire(now)
+        transfer = self.transfers.setdefault(transfer_id, [0, {}, now])
+        transfer[2] = now
+        if seq < transfer[0] or seq in transfer[1]:
+            return
+        transfer[1][seq] = items
+        while transfer[0] in transfer[1]:
+            items = transfer[1].pop(transfer[0])
+            transfer[0] += 1
+            self.deliver(items, transfer[0] >= total)
+        if transfer[0] >= total:
+            self._complete(transfer_id)
+
+    def _expire(self, now):
+        for transfer_id in [t for t, transfer in self.transfers.items()
+                            if now - transfer[2] > self.expire]:
+            Logger.warning('Playlist transfer abandoned, ' +
+                           str(self.transfers[transfer_id][0]) +
+                           ' chunks were delivered.')
+            self._complete(transfer_id)
+
+    def _complete(self, transfer_id):
+        # Later chunks of transfer_id are acknowledged and ignored
+        del self.transfers[transfer_id]
+        self.completed.append(transfer_id)
+        del self.completed[:-self.max_completed]
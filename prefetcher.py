@@ -0,0 +1,73 @@
+from time import perf_counter
+
+##################################################################
+# Fetches the metadata of the tracks around the playing track, before
+# they are played, so that a skip is answered from the cache.
+#
+# follow(playlist, position) sets the window, the window tracks either
+# side of position, nearest first and the following track before the
+# preceding one. step() fetches one track, the Player calls it when it
+# has no messages. If a fetch takes longer than busy_seconds the device
+# is assumed to be busy, and delay() asks for a backoff before the next.
+#
+# played(media_id) counts a hit if the track was prefetched.
+##################################################################
+
+class Prefetcher():
+
+    def __init__(self, fetch, window = 2, busy_seconds = 0.05,
+                 backoff = 1.0):
+        self.fetch = fetch            # fetch(media_id)
+        self.window = window
+        self.busy_seconds = busy_seconds
+        self.backoff = backoff
+        self.current = None           # media ids in the window
+        self.wanted = []              # media ids, to fetch in order
+        self.fetched = set()          # media ids in the window, fetched
+        self.wait = 0
+        self.hits = 0
+        self.misses = 0
+
+    def follow(self, playlist, position):
+        # Returns the media ids in the window, or None if unchanged
+        order = []
+        if playlist:
+            length = len(playlist)
+            for distance in range(1, self.window + 1):
+                order.append(playlist[(position + distance) % length])
+                order.append(playlist[(position - distance) % length])
+            # A short playlist wraps around to the playing track
+            playing = playlist[position]
+            order = [m for m in order if m != playing]
+        window = list(dict.fromkeys(order))
+        if window == self.current:
+            return None
+        self.current = window
+        self.fetched &= set(window)
+        self.wanted = [m for m in window if m not in self.fetched]
+        return window
+
+    def delay(self):
+        # Seconds until the next step(), None if there is nothing to do
+        return self.wait if self.wanted else None
+
+    def step(self):
+        if not self.wanted:
+            return
+        media_id = self.wanted.pop(0)
+        start = perf_counter()
+        self.fetch(media_id)
+        self.fetched.add(media_id)
+        busy = perf_counter() - start > self.busy_seconds
+        self.wait = self.backoff if busy else 0
+
+    def played(self, media_id):
+        if media_id in self.fetched:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self):
+        played = max(1, self.hits + self.misses)
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / played}
@@ -0,0 +1,141 @@
+import re
+from array import array
+from threading import Lock
+
+##################################################################
+# Search over track title, album, and album artist.
+#
+# A query matches a track if every query word is found in the track's
+# text. A word of one or two characters must start a word of the text,
+# a longer word may be anywhere in a word of the text.
+#
+# Tracks are numbered in the order they are added. For each one or two
+# character word prefix, and for each three character substring of a
+# word (a trigram), the index holds an ascending array of the numbers
+# of the tracks that contain it. A query checks the tracks in the
+# shortest array that one of its words needs, in order, and stops at
+# limit results.
+#
+# update() compares the tracks with the indexed tracks, a changed track
+# is removed and added again with a new number. Removed numbers are
+# skipped, when they are more than half of the index it is rebuilt.
+# Changes are applied in batches, so a search can run between batches.
+##################################################################
+
+_WORD = re.compile(r'\w+')
+
+
+def search_text(*fields):
+    # The indexed form of a track, ' word word ...'
+    words = _WORD.findall(' '.join(f or '' for f in fields).casefold())
+    return ' ' + ' '.join(words) + ' '
+
+
+class SearchIndex():
+
+    def __init__(self, batch = 1000):
+        self.batch = batch
+        self.lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        self.track_ids = array('q')    # number -> track_id
+        self.texts = []                # number -> search text, None if removed
+        self.numbers = {}              # track_id -> number
+        self.postings = {}             # prefix or trigram -> array of numbers
+        self.removed = 0
+
+    def __len__(self):
+        return len(self.numbers)
+
+    ##################
+    # Updates
+    ##################
+
+    def update(self, tracks):
+        # tracks are (track_id, title, album, artist), in display order.
+        # Returns the number of tracks added and removed.
+        current = {}
+        for track_id, title, album, artist in tracks:
+            current[track_id] = search_text(title, album, artist)
+        with self.lock:
+            removed = set(t for t, n in self.numbers.items()
+                          if current.get(t) != self.texts[n])
+        added = [(t, text) for t, text in current.items()
+                 if t not in self.numbers or t in removed]
+        removed = list(removed)
+        if not self.numbers or \
+           self.removed + len(removed) > len(current) // 2:
+            # Most of the index would be skipped, start again
+            with self.lock:
+                self._reset()
+            added = list(current.items())
+            removed = []
+        for i in range(0, len(removed), self.batch):
+            with self.lock:
+                for track_id in removed[i:i + self.batch]:
+                    self._remove(track_id)
+        for i in range(0, len(added), self.batch):
+            with self.lock:
+                for track_id, text in added[i:i + self.batch]:
+                    self._add(track_id, text)
+        return len(added), len(removed)
+
+    def _add(self, track_id, text):
+        number = len(self.texts)
+        self.track_ids.append(track_id)
+        self.texts.append(text)
+        self.numbers[track_id] = number
+        for key in self._keys(text):
+            posting = self.postings.get(key)
+            if posting is None:
+                posting = self.postings[key] = array('l')
+            posting.append(number)
+
+    def _remove(self, track_id):
+        number = self.numbers.pop(track_id)
+        self.texts[number] = None
+        self.removed += 1
+
+    def _keys(self, text):
+        keys = set()
+        for word in text.split():
+            keys.add(word[:1])
+            keys.add(word[:2])
+            for i in range(len(word) - 2):
+                keys.add(word[i:i + 3])
+        return keys
+
+    ##################
+    # Queries
+    ##################
+
+    def search(self, query, limit = 200):
+        # Returns matching track_ids, in the order they were added
+        words = _WORD.findall(query.casefold())
+        if not words:
+            return []
+        # As found in a search_text()
+        needles = [' ' + w if len(w) < 3 else w for w in words]
+        with self.lock:
+            shortest = None
+            for word in words:
+                if len(word) < 3:
+                    keys = [word]
+                else:
+                    keys = [word[i:i + 3] for i in range(len(word) - 2)]
+                for key in keys:
+                    posting = self.postings.get(key)
+                    if posting is None:
+                        return []
+                    if shortest is None or len(posting) < len(shortest):
+                        shortest = posting
+            results = []
+            texts = self.texts
+            for number in shortest:
+                text = texts[number]
+                if text is not None and all(n in text for n in needles):
+                    results.append(self.track_ids[number])
+                    if len(results) >= limit:
+                        break
+            return results
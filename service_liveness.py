@@ -0,0 +1,120 @@
+from threading import Lock
+from time import monotonic
+
+##################################################################
+# Is the music service running? Asked over OSC rather than by scanning
+# ActivityManager's running services.
+#
+# check(callback) sends /ping, the service answers
+#   /pong [queued messages, ms the current action has run]
+# from its OSC server thread, so a busy Player still answers at once.
+# It is busy if the current action has run for busy_seconds, or more
+# than busy_backlog messages are queued.
+#
+# pong() is called on the UI's OSC server thread, and records when the
+# pong arrived. The verdict is given on the main thread, when the pong
+# is passed to it or timeout seconds after the ping. With no pong since
+# the ping the service is not running. As the arrival time is recorded
+# off the main thread, a main thread stall that delays the pong's
+# delivery past the timeout does not make a running service look
+# stopped.
+#
+# The result is cached for ttl seconds, and any message from the
+# service, pong() or alive(), refreshes it. After stopped(), the
+# messages the service sends as it stops are not taken to show it is
+# running, until forget() when it is started again.
+#
+# send(address, values) sends an OSC message, it is an OSCClient's
+# send_message(). clock is Kivy's Clock, it is passed in so the class
+# can be driven off device (see benchmarks/liveness_harness.py).
+# Other than pong(), every method is called on the main thread.
+##################################################################
+
+RUNNING = 'running'
+BUSY = 'busy'
+NOT_RUNNING = 'not running'
+
+
+class ServiceLiveness():
+
+    def __init__(self, send, ttl = 2.0, timeout = 0.3, busy_seconds = 1.0,
+                 busy_backlog = 50, clock = None):
+        if clock is None:
+            from kivy.clock import Clock as clock
+        self.send = send
+        self.clock = clock
+        self.ttl = ttl
+        self.busy_seconds = busy_seconds
+        self.busy_backlog = busy_backlog
+        self.status = None
+        self.checked = 0
+        self.stopping = False # told to stop, alive() is ignored
+        self.waiting = []     # callbacks for the ping in flight
+        self.pinged = 0       # monotonic() when the last ping was sent
+        self.lock = Lock()
+        self.answer = None    # (monotonic() at arrival, status), last pong
+        self.expire = clock.create_trigger(self._timed_out, timeout)
+
+    def check(self, callback):
+        # callback(status), at once if the cached status is fresh
+        if self.status and monotonic() - self.checked < self.ttl:
+            callback(self.status)
+            return
+        self.waiting.append(callback)
+        if len(self.waiting) == 1:
+            self.pinged = monotonic()
+            self.send(b'/ping', [])
+            self.expire()
+
+    def pong(self, backlog, action_ms):
+        # Called on the OSC server thread
+        if action_ms > self.busy_seconds * 1000 or\
+           backlog > self.busy_backlog:
+            status = BUSY
+        else:
+            status = RUNNING
+        with self.lock:
+            self.answer = (monotonic(), status)
+        self.clock.schedule_once(self._answered)
+
+    def alive(self):
+        # Any other message from the service
+        if not self.stopping:
+            self._resolve(RUNNING, monotonic())
+
+    def forget(self):
+        # The next check() pings, for example after starting the service
+        self.status = None
+        self.stopping = False
+
+    def stopped(self):
+        # The service was told to stop, the next check() pings
+        self.status = None
+        self.stopping = True
+
+    def _answered(self, dt):
+        # A late pong still shows the service is running. A pong from
+        # before the ping in flight does not answer it.
+        with self.lock:
+            arrived, status = self.answer
+        if arrived >= self.pinged or not self.waiting:
+            self._resolve(status, arrived)
+
+    def _timed_out(self, dt):
+        if not self.waiting:
+            return
+        with self.lock:
+            answer = self.answer
+        if answer and answer[0] >= self.pinged:
+            self._resolve(answer[1], answer[0])
+        else:
+            self._resolve(NOT_RUNNING, monotonic())
+
+    def _resolve(self, status, at):
+        self.status = status
+        self.checked = at
+        self.expire.cancel()
+        waiting = self.waiting
+        self.waiting = []
+        for callback in waiting:
+            callback(status)
@@ -0,0 +1,109 @@
+import sys
+import threading
+from time import perf_counter
+
+##################################################################
+# Startup profile, import time per module and time to first frame.
+#
+# install() adds an import hook that times each module's execution on
+# the main thread. A module's total includes the modules it imports,
+# its self time does not. report(event) logs the time since this module
+# was imported, and the slowest imports since the previous report.
+# finish() removes the hook.
+#
+# Import this module, and install(), before any other.
+##################################################################
+
+TOP_MODULES = 15
+
+_start = perf_counter()
+_imports = []     # (name, total s, self s), in the order they completed
+_children = []    # time in nested imports, one entry per import running
+_reported = 0
+_finder = None
+
+
+class _TimedLoader():
+    # Wraps a module's loader, other loader attributes are passed through
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        _children.append(0.0)
+        start = perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            total = perf_counter() - start
+            children = _children.pop()
+            if _children:
+                _children[-1] += total
+            _imports.append((module.__name__, total, total - children))
+
+
+class _TimedFinder():
+
+    def find_spec(self, name, path, target = None):
+        if threading.current_thread() is not threading.main_thread():
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader)
+        return spec
+
+
+def install():
+    global _finder
+    if _finder is None:
+        _finder = _TimedFinder()
+        sys.meta_path.insert(0, _finder)
+
+
+def finish():
+    global _finder
+    if _finder in sys.meta_path:
+        sys.meta_path.remove(_finder)
+    _finder = None
+
+
+def elapsed_ms():
+    return (perf_counter() - _start) * 1000
+
+
+def report(event):
+    global _reported
+    from kivy.logger import Logger
+    imports = _imports[_reported:]
+    _reported = len(_imports)
+    import_ms = sum(i[2] for i in imports) * 1000
+    Logger.info('Startup: ' + event + ' at ' + str(round(elapsed_ms())) +
+                ' ms, ' + str(len(imports)) + ' imports ' +
+                str(round(import_ms)) + ' ms')
+    imports.sort(key = lambda i: i[1], reverse = True)
+    for name, total, own in imports[:TOP_MODULES]:
+        Logger.info('Startup:   ' + name + ' ' + format(total * 1000, '.1f') +
+                    ' ms, self ' + format(own * 1000, '.1f') + ' ms')
+
+
+def after_first_frame(callback):
+    # callback() once the first frame is on screen
+    from kivy.core.window import Window
+
+    def on_flip(window):
+        Window.unbind(on_flip = on_flip)
+        callback()
+    Window.bind(on_flip = on_flip)
@@ -1,26 +1,137 @@
-import random
-import string
+from collections import OrderedDict
 from kivy.core.text import Label as CoreLabel
-from textwrap import fill
+
+##################################################################
+# Wraps text to a pixel width, for a Label with the default font.
+#
+# Glyph widths are measured once per (font_size, bold), each character
+# on first use, so a short title measures a few glyphs. Wrapped strings are
+# memoized per (font_size, bold, width, max_lines), for the FIT_KEYS
+# most recently used keys.
+# A Window resize drops the memoized results that are now wider than
+# the Window, results for other widths are still valid. The Window is
+# bound by the first StringLines(), so an import does not create it.
+##################################################################
+
+# Shared by every StringLines instance
+_glyph_widths = {}   # (font_size, bold) -> {char: width}
+_labels = {}         # (font_size, bold) -> CoreLabel
+_fits = OrderedDict()  # (font_size, bold, width, max_lines) -> {string: fit}
+FIT_KEYS = 16
+FITS_PER_KEY = 2000
+_window_bound = False
+
+
+def _on_window_width(window, width):
+    for key in [k for k in _fits if k[2] > width]:
+        del _fits[key]
+
+
+def _bind_window():
+    global _window_bound
+    if not _window_bound:
+        _window_bound = True
+        from kivy.core.window import Window
+        # None without a window provider, then there are no resizes
+        if Window is not None:
+            Window.bind(width=_on_window_width)
 
 
 class StringLines():
 
-    def estimate_columns(self, font_size, widget_width):
-        s = ''.join(random.choices(string.ascii_lowercase, k = 80)) +\
-            ''.join(random.choices(string.ascii_uppercase, k = 20))
-        l = CoreLabel(font_size= font_size)
-        per_char = l.get_extents(s)[0] // 100
-        return widget_width // per_char -1
-
-    def multiline_string(self, string, max_columns, max_lines = None):
-        if len(string) > max_columns:
-            multiline = fill(str(string), max_columns)
-            if max_lines:
-                # Setting max_lines may truncate the string
-                lines = multiline.split('\n')
-                return '\n'.join(lines[:max_lines])
-            else:
-                return multiline
+    def __init__(self):
+        _bind_window()
+
+    def glyph_widths(self, font_size, bold = False):
+        key = (font_size, bold)
+        widths = _glyph_widths.get(key)
+        if widths is None:
+            widths = {}
+            label = CoreLabel(font_size = font_size, bold = bold)
+            # A space alone may measure as zero width
+            widths[' '] = label.get_extents('x x')[0] -\
+                label.get_extents('xx')[0]
+            _labels[key] = label
+            _glyph_widths[key] = widths
+        return widths
+
+    def text_width(self, text, font_size, bold = False):
+        widths = self.glyph_widths(font_size, bold)
+        total = 0
+        for c in text:
+            w = widths.get(c)
+            if w is None:
+                w = widths[c] = _labels[(font_size, bold)].get_extents(c)[0]
+            total += w
+        return total
+
+    def fit(self, text, font_size, width, max_lines = None, bold = False):
+        # Returns text with newlines inserted so each line fits in width
+        # pixels, setting max_lines may truncate the text.
+        key = (font_size, bold, width, max_lines)
+        fits = _fits.get(key)
+        if fits is None:
+            fits = _fits[key] = {}
+            if len(_fits) > FIT_KEYS:
+                _fits.popitem(last = False)
         else:
-            return string
+            _fits.move_to_end(key)
+        text = str(text)
+        result = fits.get(text)
+        if result is None:
+            result = self._wrap(text, font_size, bold, width, max_lines)
+            if len(fits) >= FITS_PER_KEY:
+                fits.clear()
+            fits[text] = result
+        return result
+
+    def fit_many(self, texts, font_size, width, max_lines = None,
+                 bold = False):
+        return [self.fit(t, font_size, width, max_lines, bold) for t in texts]
+
+    def fit_data(self, data, key, font_size, width, max_lines = None,
+                 bold = False):
+        # Fits data[i][key] in place, for a RecycleView's data
+        for item in data:
+            item[key] = self.fit(item[key], font_size, width, max_lines, bold)
+        return data
+
+    def _wrap(self, text, font_size, bold, width, max_lines):
+        if self.text_width(text, font_size, bold) <= width:
+            return text
+        space = self.glyph_widths(font_size, bold)[' ']
+        lines = []
+        line = ''
+        line_width = 0
+        for word in text.split():
+            word_width = self.text_width(word, font_size, bold)
+            if line and line_width + space + word_width <= width:
+                line += ' ' + word
+                line_width += space + word_width
+                continue
+            if line:
+                lines.append(line)
+            # A word wider than the line is broken between characters
+            while word_width > width and len(word) > 1:
+                head = self._head(word, font_size, bold, width)
+                lines.append(head)
+                word = word[len(head):]
+                word_width = self.text_width(word, font_size, bold)
+            line = word
+            line_width = word_width
+            if max_lines and len(lines) >= max_lines:
+                break
+        if line:
+            lines.append(line)
+        if max_lines:
+            lines = lines[:max_lines]
+        return '\n'.join(lines)
+
+    def _head(self, word, font_size, bold, width):
+        # The longest prefix of word that fits, at least one character
+        total = 0
+        for i, c in enumerate(word):
+            total += self.text_width(c, font_size, bold)
+            if total > width:
+                return word[:max(i, 1)]
+        return word
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+
+##################################################################
+# A least recently used cache of Kivy Textures, bounded by the total
+# size of the texture pixels.
+# Keys are (media_id, resolution). Not thread safe, use on the main thread.
+##################################################################
+
+class TextureCache():
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.entries = OrderedDict()   # key -> (texture, nbytes)
+
+    def __contains__(self, key):
+        # Does not count as a hit or miss
+        return key in self.entries
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, texture, nbytes = None):
+        if nbytes is None:
+            width, height = texture.size
+            nbytes = width * height * 4
+        if nbytes > self.max_bytes:
+            return
+        self.remove(key)
+        self.entries[key] = (texture, nbytes)
+        self.bytes += nbytes
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last = False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.bytes -= entry[1]
+
+    def keys(self):
+        return list(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.bytes,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
@@ -0,0 +1,112 @@
+from collections import deque
+from threading import Thread, Condition
+from weakref import WeakSet
+from time import perf_counter
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+##################################################################
+# Loads album art on worker threads.
+#
+# decode(media_id, resolution) runs on a worker, it returns
+# (size, pixels) or None. deliver(media_id, resolution, decoded) runs
+# on the main thread, it returns a texture or None and is given at most
+# frame_budget seconds of each frame.
+#
+# Requests are grouped by an owner (usually a widget), cancel(owner)
+# drops the owner's queued requests and any results not yet delivered.
+# A request with replace=True drops the owner's queued requests and
+# puts the new ones, in the given order, ahead of every other request.
+# This is used to follow a scrolling list. drop_pending(owner) drops
+# the owner's queued requests only.
+##################################################################
+
+class ThumbnailLoader():
+
+    def __init__(self, decode, deliver, workers = 2, frame_budget = 0.004):
+        self.decode = decode
+        self.deliver = deliver
+        self.frame_budget = frame_budget
+        self.condition = Condition()
+        self.pending = deque()   # (owner, tag, media_id, resolution, callback)
+        self.done = deque()      # (owner, tag, media_id, resolution, callback,
+                                 #  decoded)
+        self.cancelled = WeakSet()
+        self.busy = set()        # (owner, tag) decoding or not yet delivered,
+                                 # only for requests with an owner
+        self.trigger = Clock.create_trigger(self._deliver)
+        for i in range(workers):
+            Thread(target=self._worker, daemon=True).start()
+
+    def request(self, owner, jobs, callback, replace = False):
+        # jobs are (tag, media_id, resolution), callback(tag, texture).
+        # An owner's job already being decoded is not repeated, a job
+        # with no owner is always loaded as its callback must run.
+        with self.condition:
+            if owner is not None:
+                self.cancelled.discard(owner)
+            new = [(owner, tag, media_id, resolution, callback)
+                   for tag, media_id, resolution in jobs
+                   if owner is None or (owner, tag) not in self.busy]
+            if replace:
+                self.pending = deque(job for job in self.pending
+                                     if job[0] is not owner)
+                self.pending.extendleft(reversed(new))
+            else:
+                self.pending.extend(new)
+            self.condition.notify(len(new))
+
+    def drop_pending(self, owner):
+        # Drops the owner's queued requests, those being decoded are kept
+        with self.condition:
+            self.pending = deque(job for job in self.pending
+                                 if job[0] is not owner)
+
+    def cancel(self, owner):
+        with self.condition:
+            self.cancelled.add(owner)
+            self.pending = deque(job for job in self.pending
+                                 if job[0] is not owner)
+            self.busy = set(b for b in self.busy if b[0] is not owner)
+
+    ##################
+    # Worker threads
+    ##################
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                job = self.pending.popleft()
+                if job[0] is not None:
+                    self.busy.add((job[0], job[1]))
+            try:
+                decoded = self.decode(job[2], job[3])
+            except Exception as e:
+                Logger.warning('Thumbnail decode failed.\n' + str(e))
+                decoded = None
+            with self.condition:
+                if job[0] in self.cancelled:
+                    self.busy.discard((job[0], job[1]))
+                    continue
+                self.done.append(job + (decoded,))
+            self.trigger()
+
+    ##################
+    # Main thread
+    ##################
+
+    def _deliver(self, dt):
+        deadline = perf_counter() + self.frame_budget
+        while perf_counter() < deadline:
+            with self.condition:
+                if not self.done:
+                    return
+                owner, tag, media_id, resolution, callback, decoded =\
+                    self.done.popleft()
+                self.busy.discard((owner, tag))
+                if owner in self.cancelled:
+                    continue
+            callback(tag, self.deliver(media_id, resolution, decoded))
+        self.trigger()
@@ -0,0 +1,149 @@
+import os
+import mmap
+import struct
+from collections import OrderedDict
+from threading import Lock
+from kivy.logger import Logger
+
+##################################################################
+# A persistent store of decoded RGBA album art, bounded by total size.
+#
+# Each thumbnail is a raw pixel blob file, read back memory mapped so
+# the pixels can be passed to Texture.blit_buffer() without a copy.
+# release_pixels() unmaps them once they are uploaded.
+# Entries are keyed by (media_id, resolution) and the media file's
+# modification stamp, an entry with an old stamp is discarded.
+#
+# The index is a file of fixed size records, appended on put() and
+# rewritten when entries are evicted. Later records replace earlier ones.
+#
+# get() and put() may be called from any thread.
+##################################################################
+
+# media_id, resolution, modified, width, height
+RECORD = struct.Struct('<qIqHH')
+INDEX = 'index.bin'
+
+
+def release_pixels(pixels):
+    # Closes the mapping of pixels returned by get(), other buffers are
+    # left to the garbage collector.
+    if isinstance(pixels, memoryview) and isinstance(pixels.obj, mmap.mmap):
+        mapping = pixels.obj
+        pixels.release()
+        mapping.close()
+
+
+class ThumbnailStore():
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        # (media_id, resolution) -> (modified, width, height), LRU order
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        os.makedirs(directory, exist_ok = True)
+        self._load_index()
+
+    def get(self, media_id, resolution, modified):
+        # Returns ((width, height), memoryview) or None
+        with self.lock:
+            return self._get(media_id, resolution, modified)
+
+    def put(self, media_id, resolution, modified, size, pixels):
+        with self.lock:
+            self._put(media_id, resolution, modified, size, pixels)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self._remove(key, rewrite = False)
+            self._write_index()
+
+    ##################
+    # Files
+    ##################
+
+    def _get(self, media_id, resolution, modified):
+        key = (media_id, resolution)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != modified:
+            self._remove(key)
+            return None
+        try:
+            with open(self._blob_path(key, entry[0]), 'rb') as f:
+                pixels = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return (entry[1], entry[2]), memoryview(pixels)
+
+    def _put(self, media_id, resolution, modified, size, pixels):
+        key = (media_id, resolution)
+        if key in self.entries:
+            self._remove(key)
+        if size[0] * size[1] * 4 > self.max_bytes:
+            return
+        try:
+            with open(self._blob_path(key, modified), 'wb') as f:
+                f.write(pixels)
+            with open(os.path.join(self.directory, INDEX), 'ab') as f:
+                f.write(RECORD.pack(media_id, resolution, modified, *size))
+        except OSError as e:
+            Logger.warning('Thumbnail store write failed.\n' + str(e))
+            return
+        self.entries[key] = (modified, size[0], size[1])
+        self.bytes += size[0] * size[1] * 4
+        if self.bytes > self.max_bytes:
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)), rewrite = False)
+            self._write_index()
+
+    def _blob_path(self, key, modified):
+        return os.path.join(self.directory,
+                            '{}_{}_{}.rgba'.format(key[0], key[1], modified))
+
+    def _remove(self, key, rewrite = True):
+        modified, width, height = self.entries.pop(key)
+        self.bytes -= width * height * 4
+        try:
+            os.remove(self._blob_path(key, modified))
+        except OSError:
+            pass
+        if rewrite:
+            self._write_index()
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return
+        records = len(data) // RECORD.size
+        for media_id, resolution, modified, width, height in\
+            RECORD.iter_unpack(data[:records * RECORD.size]):
+            key = (media_id, resolution)
+            self.entries.pop(key, None)
+            self.entries[key] = (modified, width, height)
+        for key, (modified, width, height) in list(self.entries.items()):
+            if os.path.exists(self._blob_path(key, modified)):
+                self.bytes += width * height * 4
+            else:
+                del self.entries[key]
+        if len(self.entries) != records:
+            self._write_index()
+
+    def _write_index(self):
+        path = os.path.join(self.directory, INDEX)
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                for key, (modified, width, height) in self.entries.items():
+                    f.write(RECORD.pack(key[0], key[1], modified,
+                                        width, height))
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            Logger.warning('Thumbnail store index write failed.\n' + str(e))
@@ -0,0 +1,41 @@
+from kivy.logger import Logger
+from jnius import autoclass
+
+ContentUris = autoclass('android.content.ContentUris')
+MediaStore = autoclass('android.provider.MediaStore')
+MediaStoreConstants = autoclass('org.kivy.player.MediaStoreConstants')
+
+##################################################################
+# Track metadata for the service, so that the UI is sent the title and
+# artist with the track and does not query the MediaStore itself.
+##################################################################
+
+class TrackInfo():
+
+    def __init__(self, context):
+        self.context = context
+        self.resolver = context.getContentResolver()
+
+    def generation(self):
+        # Changes when the MediaStore changes, for MetadataCache
+        return MediaStore.getGeneration(self.context,
+                                        MediaStore.VOLUME_EXTERNAL)
+
+    def lookup(self, media_id):
+        # Returns (title, artist)
+        title = ''
+        artist = ''
+        try:
+            track_uri = ContentUris.withAppendedId(
+                MediaStoreConstants.MEDIA_TABLE, media_id)
+            columns = [MediaStoreConstants.TITLE,
+                       MediaStoreConstants.ALBUM_ARTIST]
+            cursor = self.resolver.query(track_uri, columns, None, None, None)
+            if cursor and cursor.moveToFirst():
+                title = cursor.getString(0) or ''
+                artist = cursor.getString(1) or ''
+            if cursor:
+                cursor.close()
+        except Exception as e:
+            Logger.error('Mediastore Track Info error.\n' + str(e))
+        return title, artist